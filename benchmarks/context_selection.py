@@ -0,0 +1,86 @@
+"""Compare prompt context strategies on a labelled corpus.
+
+Strategies are the full OCR text, the former fixed head/tail slice (1,000 + 500
+characters) and the adaptive selection of context.select_context at one or more
+token budgets. The corpus has the layout of extraction_modes.py.
+
+With a live Ollama every strategy runs the single-field calls and reports prompt
+tokens and per-field accuracy:
+
+    OLLAMA_HOST=http://localhost:11434 python benchmarks/context_selection.py corpus/
+
+--offline skips the LLM and reports context size and how often the labelled sender
+and document type still appear verbatim in the selected context.
+"""
+import sys
+import json
+import argparse
+import statistics
+
+from extraction_modes import benchmark
+from extraction_modes import load_corpus
+from extraction_modes import recording_generate
+from extraction_modes import run_single
+
+import functions
+from config import Config
+from context import estimate_tokens
+from context import select_context
+
+def head_and_tail(text: str, head_length: int = 1000, tail_length: int = 500) -> str:
+    if len(text) <= head_length + tail_length:
+        return text
+    return f"<HEAD>\n{text[:head_length]}\n</HEAD>\n<TAIL>\n{text[-tail_length:]}\n</TAIL>"
+
+def strategies(budgets: list) -> dict:
+    result = {
+        "full": lambda text: text,
+        "head_tail": head_and_tail,
+    }
+    for budget in budgets:
+        result[f"adaptive_{budget}"] = lambda text, budget=budget: select_context(text, budget)
+    return result
+
+def offline(name: str, select, corpus: dict, labels: dict) -> dict:
+    tokens = []
+    contained = {"sender": [0, 0], "document_type": [0, 0]}
+    for file_name, content in corpus.items():
+        context = select(content)
+        tokens.append(estimate_tokens(context))
+        for field, counts in contained.items():
+            expected = labels.get(file_name, {}).get(field)
+            if expected:
+                counts[1] += 1
+                counts[0] += expected.casefold() in context.casefold()
+    return {
+        "strategy": name,
+        "documents": len(corpus),
+        "context_tokens_mean": round(statistics.mean(tokens), 1),
+        "context_tokens_max": max(tokens),
+        "label_in_context": {field: round(hit / total, 3) for field, (hit, total) in contained.items() if total},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="directory with .txt documents and an optional labels.json")
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N documents")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[256, 512, 1024], help="token budgets to compare")
+    parser.add_argument("--offline", action="store_true", help="do not call Ollama")
+    args = parser.parse_args()
+
+    corpus, labels = load_corpus(args.corpus, args.limit)
+    if args.offline:
+        for name, select in strategies(args.budgets).items():
+            print(json.dumps(offline(name, select, corpus, labels), ensure_ascii=False))
+        return
+
+    functions.generate = recording_generate(functions.generate)
+    # The generate_* calls select context themselves, lift the budget so they use the given text as is
+    Config.CONTEXT_TOKEN_BUDGET = sys.maxsize
+    for name, select in strategies(args.budgets).items():
+        result = benchmark(name, run_single, corpus, labels, select=select)
+        result["context_tokens_mean"] = round(statistics.mean(estimate_tokens(select(c)) for c in corpus.values()), 1)
+        print(json.dumps(result, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
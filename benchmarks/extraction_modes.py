@@ -0,0 +1,112 @@
+"""Compare single-field and combined extraction against a live Ollama.
+
+The corpus is a directory of .txt files (OCR content). An optional labels.json
+maps file names to the expected {"titel", "sender", "document_type", "tax_relevant"}.
+
+    OLLAMA_HOST=http://localhost:11434 python benchmarks/extraction_modes.py corpus/
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("DATA_DIRECTORY", tempfile.mkdtemp(prefix="paperless-ollama-bench-"))
+
+import functions
+
+calls = []
+
+def recording_generate(generate):
+    def wrapper(**kwargs):
+        response = generate(**kwargs)
+        calls.append({
+            "prompt_eval_count": response.prompt_eval_count or 0,
+            "eval_count": response.eval_count or 0,
+        })
+        return response
+    return wrapper
+
+def run_single(text: str) -> dict:
+    return {
+        "titel": functions.generate_title(text, similar_document_title=""),
+        "sender": functions.generate_correspondent_name(text, similar_correspondent_name=""),
+        "document_type": functions.generate_document_type_name(text, similar_document_type_name=""),
+        "tax_relevant": functions.generate_tax_report_relevance(text),
+    }
+
+def run_combined(text: str) -> dict:
+    fields = functions.generate_classification(text, "", "", "")
+    # Fields that failed validation are filled by the single-field calls, as in the pipeline
+    if "titel" not in fields:
+        fields["titel"] = functions.generate_title(text, similar_document_title="")
+    if "sender" not in fields:
+        fields["sender"] = functions.generate_correspondent_name(text, similar_correspondent_name="")
+    if "document_type" not in fields:
+        fields["document_type"] = functions.generate_document_type_name(text, similar_document_type_name="")
+    if "tax_relevant" not in fields:
+        fields["tax_relevant"] = functions.generate_tax_report_relevance(text)
+    return fields
+
+def field_matches(expected, actual) -> bool:
+    if isinstance(expected, str):
+        return str(actual).strip().lower() == expected.strip().lower()
+    return expected == actual
+
+def benchmark(name: str, run, corpus: dict, labels: dict, select = None) -> dict:
+    select = select or functions.select_context
+    latencies = []
+    correct = {field: 0 for field in ("titel", "sender", "document_type", "tax_relevant")}
+    labelled = {field: 0 for field in correct}
+    calls.clear()
+    for file_name, content in corpus.items():
+        text = select(content)
+        start = time.perf_counter()
+        result = run(text)
+        latencies.append(time.perf_counter() - start)
+        for field, expected in labels.get(file_name, {}).items():
+            if field in correct:
+                labelled[field] += 1
+                correct[field] += field_matches(expected, result.get(field))
+
+    return {
+        "mode": name,
+        "documents": len(corpus),
+        "generate_calls": len(calls),
+        "prompt_tokens": sum(call["prompt_eval_count"] for call in calls),
+        "eval_tokens": sum(call["eval_count"] for call in calls),
+        "latency_mean_s": round(statistics.mean(latencies), 3),
+        "latency_p95_s": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))], 3),
+        "accuracy": {field: round(correct[field] / labelled[field], 3) for field in correct if labelled[field]},
+    }
+
+def load_corpus(directory: str, limit: int = None) -> tuple:
+    file_names = sorted(f for f in os.listdir(directory) if f.endswith(".txt"))[:limit]
+    corpus = {}
+    for file_name in file_names:
+        with open(os.path.join(directory, file_name), encoding="utf-8") as f:
+            corpus[file_name] = f.read()
+    labels_path = os.path.join(directory, "labels.json")
+    labels = {}
+    if os.path.exists(labels_path):
+        with open(labels_path, encoding="utf-8") as f:
+            labels = json.load(f)
+    return corpus, labels
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="directory with .txt documents and an optional labels.json")
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N documents")
+    args = parser.parse_args()
+
+    corpus, labels = load_corpus(args.corpus, args.limit)
+
+    functions.generate = recording_generate(functions.generate)
+    for name, run in (("single", run_single), ("combined", run_combined)):
+        print(json.dumps(benchmark(name, run, corpus, labels), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
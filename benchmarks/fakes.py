@@ -0,0 +1,302 @@
+"""Local stand-ins for Paperless and Ollama used by the offline benchmarks.
+
+Both are plain HTTP servers on 127.0.0.1, so the real requests session and Ollama
+client are exercised including connection pooling and JSON (de)serialization.
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+
+from collections import Counter
+from datetime import datetime
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlencode
+from urllib.parse import urlparse
+
+import numpy as np
+
+ENTITY_KINDS = ("documents", "tags", "correspondents", "document_types")
+DOCUMENT_TYPE_WORDS = ("Rechnung", "Kontoauszug", "Bescheid", "Vertrag", "Mahnung", "Gutschrift", "Lohnabrechnung")
+FILLER = (
+    "Leistung", "Position", "Zeitraum", "gemäß", "Vereinbarung", "Menge", "Betrag", "bitte", "überweisen",
+    "Sie", "den", "die", "der", "und", "wir", "Ihnen", "mit", "freundlichen", "Grüßen", "Kunde", "Vorgang"
+)
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class _Server:
+    """ Threading HTTP server running in the background """
+
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _send(self, status: int, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FakePaperless(_Server):
+    """ In-memory Paperless REST API for documents, tags, correspondents and document types """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(_PaperlessHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.store = {kind: {} for kind in ENTITY_KINDS}
+        self.calls = Counter()
+
+    def add(self, kind: str, entity: dict):
+        with self.lock:
+            self.store[kind][entity["id"]] = entity
+
+    def next_id(self, kind: str) -> int:
+        return max(self.store[kind], default=0) + 1
+
+    def list(self, kind: str, query: dict) -> list:
+        with self.lock:
+            items = list(self.store[kind].values())
+        if "id__in" in query:
+            ids = {int(id) for id in query["id__in"].split(",") if id}
+            items = [item for item in items if item["id"] in ids]
+        if "id__gt" in query:
+            items = [item for item in items if item["id"] > int(query["id__gt"])]
+        if "modified__gt" in query:
+            items = [item for item in items if item.get("modified", "") > query["modified__gt"]]
+        if "tags__id__all" in query:
+            required = {int(id) for id in query["tags__id__all"].split(",")}
+            items = [item for item in items if required <= set(item.get("tags", []))]
+        return sorted(items, key=lambda item: item["id"])
+
+class _PaperlessHandler(_Handler):
+    ROUTE = re.compile(r"^/api/(documents|tags|correspondents|document_types)/(?:(\d+)/)?$")
+
+    def _route(self):
+        server = self.server.owner
+        parsed = urlparse(self.path)
+        match = self.ROUTE.match(parsed.path)
+        if match is None:
+            self._send(404, {"detail": "Not found."})
+            return None
+        if server.latency:
+            time.sleep(server.latency)
+        kind, id = match.group(1), match.group(2)
+        server.calls[(self.command, kind if id is None else f"{kind}/<id>")] += 1
+        return server, kind, int(id) if id else None, {k: v[0] for k, v in parse_qs(parsed.query).items()}
+
+    def do_GET(self):
+        route = self._route()
+        if route is None:
+            return
+        server, kind, id, query = route
+        if id is not None:
+            entity = server.store[kind].get(id)
+            self._send(200, entity) if entity else self._send(404, {"detail": "Not found."})
+            return
+
+        items = server.list(kind, query)
+        page = int(query.get("page", 1))
+        page_size = int(query.get("page_size", 25))
+        results = items[(page - 1) * page_size:page * page_size]
+        if "fields" in query:
+            fields = query["fields"].split(",")
+            results = [{field: item.get(field) for field in fields} for item in results]
+        next_url = None
+        if page * page_size < len(items):
+            next_url = f"{server.url}/api/{kind}/?{urlencode({**query, 'page': page + 1})}"
+        self._send(200, {"count": len(items), "next": next_url, "previous": None, "results": results})
+
+    def do_POST(self):
+        route = self._route()
+        if route is None:
+            return
+        server, kind, _, _ = route
+        body = self._body()
+        with server.lock:
+            entity = {"id": server.next_id(kind), "name": body["name"]}
+            server.store[kind][entity["id"]] = entity
+        self._send(201, entity)
+
+    def do_PATCH(self):
+        route = self._route()
+        if route is None:
+            return
+        server, kind, id, _ = route
+        with server.lock:
+            entity = server.store[kind].get(id)
+            if entity is None:
+                self._send(404, {"detail": "Not found."})
+                return
+            entity.update(self._body())
+            entity["modified"] = _now()
+            result = dict(entity)
+        self._send(200, result)
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+def fake_embedding(text: str, dimensions: int) -> list:
+    """ Deterministic bag of hashed words, similar texts get similar vectors """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in re.findall(r"\w+", text.casefold()):
+        vector[_hash(word) % dimensions] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+def _document_text(prompt: str) -> str:
+    match = re.search(r"<DOCUMENT>(.*?)</DOCUMENT>", prompt, re.DOTALL)
+    return (match.group(1) if match else prompt).strip()
+
+def fake_field(model: str, name: str, schema: dict, text: str):
+    """ Deterministic answer for one field of a response model, derived from the document text """
+    lines = [line.strip() for line in text.splitlines() if line.strip() and line.strip() != "[...]"]
+    if schema.get("type") == "boolean":
+        return _hash(text) % 4 == 0
+    if (model, name) in (("Sender", "name"), ("DocumentClassification", "sender")):
+        return lines[0] if lines else "Unbekannt"
+    if (model, name) in (("DocumentType", "name"), ("DocumentClassification", "document_type")):
+        return next((word for word in DOCUMENT_TYPE_WORDS if word in text), "Dokument")
+    return " ".join(lines[1:3])[:60] if len(lines) > 1 else "Dokument"
+
+class FakeOllama(_Server):
+    """ Ollama /api/generate and /api/embed with deterministic answers and simulated latency
+
+    Setting failing makes every request answer 503, like a host that is overloaded or restarting.
+    """
+
+    def __init__(self, generate_latency: float = 0.0, embed_latency: float = 0.0, dimensions: int = 64):
+        super().__init__(_OllamaHandler)
+        self.generate_latency = generate_latency
+        self.embed_latency = embed_latency
+        self.dimensions = dimensions
+        self.failing = False
+        self.calls = Counter()
+
+class _OllamaHandler(_Handler):
+    def do_GET(self):
+        if self.server.owner.failing:
+            self._send(503, {"error": "unavailable"})
+        elif self.path == "/api/ps":
+            self._send(200, {"models": []})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        server = self.server.owner
+        body = self._body()
+        if server.failing:
+            server.calls["failed"] += 1
+            self._send(503, {"error": "unavailable"})
+            return
+        if self.path == "/api/generate":
+            server.calls["generate"] += 1
+            time.sleep(server.generate_latency)
+            text = _document_text(body.get("prompt", ""))
+            schema = body.get("format") or {}
+            response = {
+                name: fake_field(schema.get("title"), name, field, text)
+                for name, field in schema.get("properties", {}).items()
+            }
+            prompt_tokens = len(body.get("prompt", "")) // 4
+            duration = int(server.generate_latency * 1e9)
+            self._send(200, {
+                "model": body.get("model"),
+                "created_at": _now(),
+                "response": json.dumps(response, ensure_ascii=False),
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": duration,
+                "load_duration": 0,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": duration // 2,
+                "eval_count": 16,
+                "eval_duration": duration // 2,
+            })
+        elif self.path == "/api/embed":
+            inputs = body.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            server.calls["embed"] += 1
+            server.calls["embed_inputs"] += len(inputs)
+            time.sleep(server.embed_latency)
+            self._send(200, {
+                "model": body.get("model"),
+                "embeddings": [fake_embedding(text, server.dimensions) for text in inputs],
+            })
+        else:
+            self._send(404, {"error": "not found"})
+
+def populate(paperless: FakePaperless, entities: int, documents: int, seed: int = 0, recurring: bool = False):
+    """ Synthetic catalog of correspondents, document types and tags plus documents that reference them
+
+    With recurring every correspondent writes with its own small vocabulary, like the
+    letters of one sender in a real archive resemble each other.
+    """
+    generator = random.Random(seed)
+    for id in range(1, entities + 1):
+        paperless.add("correspondents", {"id": id, "name": f"Firma {id} GmbH"})
+        paperless.add("tags", {"id": id, "name": f"Tag {id}"})
+    for id, word in enumerate(DOCUMENT_TYPE_WORDS, start=1):
+        paperless.add("document_types", {"id": id, "name": word})
+    for id in range(len(DOCUMENT_TYPE_WORDS) + 1, min(entities, 500) + 1):
+        paperless.add("document_types", {"id": id, "name": f"Typ {id}"})
+
+    modified = _now()
+    for id in range(1, documents + 1):
+        correspondent = generator.randint(1, entities)
+        document_type = generator.randint(1, len(DOCUMENT_TYPE_WORDS))
+        word = DOCUMENT_TYPE_WORDS[document_type - 1]
+        day, month = generator.randint(1, 28), generator.randint(1, 12)
+        lines = [
+            f"Firma {correspondent} GmbH",
+            f"Musterstraße {correspondent % 200 + 1}",
+            f"{10000 + correspondent % 89999} Musterstadt",
+            f"{day}.{month}.2024",
+            f"{word} Nr. {id}",
+        ]
+        vocabulary = random.Random(correspondent).sample(FILLER, 6) if recurring else FILLER
+        for _ in range(generator.randint(20, 120)):
+            lines.append(" ".join(generator.choice(vocabulary) for _ in range(generator.randint(4, 12))))
+        lines.append(f"Gesamtbetrag {generator.randint(1, 999)},{generator.randint(10, 99)} EUR")
+        lines.append(f"IBAN DE{generator.randint(10, 99)} 3704 0044 0532 0130 00")
+        paperless.add("documents", {
+            "id": id,
+            "title": f"{word} {id}",
+            "correspondent": correspondent,
+            "document_type": document_type,
+            "tags": [],
+            "created": f"2024-{month:02d}-{day:02d}",
+            "modified": modified,
+            "content": "\n".join(lines),
+        })
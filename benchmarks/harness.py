@@ -0,0 +1,160 @@
+"""Offline throughput benchmark of the sync and identify paths.
+
+Starts a fake Paperless and a deterministic fake Ollama (see fakes.py), fills Paperless
+with a synthetic catalog and runs the sync_* functions and identify_and_update_document
+against them. Every phase reports wall time, latency percentiles, calls per backend and
+peak memory, so regressions show up before a deployment.
+
+    python benchmarks/harness.py --entities 1000 --documents 1000 --identify 100
+    python benchmarks/harness.py --entities 100000 --documents 5000 --identify 200 --concurrency 4 --generate-latency-ms 50
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import tracemalloc
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import FakeOllama
+from fakes import FakePaperless
+from fakes import populate
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+class Phase:
+    """ Measures wall time, backend calls and memory of a block """
+
+    def __init__(self, name: str, paperless: FakePaperless, ollama: FakeOllama, trace_memory: bool):
+        self.name = name
+        self.paperless = paperless
+        self.ollama = ollama
+        self.trace_memory = trace_memory
+        self.latencies = []
+
+    def __enter__(self):
+        self.paperless_before = Counter(self.paperless.calls)
+        self.ollama_before = Counter(self.ollama.calls)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.start
+        self.paperless_calls = Counter(self.paperless.calls) - self.paperless_before
+        self.ollama_calls = Counter(self.ollama.calls) - self.ollama_before
+        self.python_peak_mb = round(tracemalloc.get_traced_memory()[1] / 2**20, 1) if self.trace_memory else None
+
+    def report(self) -> dict:
+        result = {
+            "phase": self.name,
+            "seconds": round(self.seconds, 3),
+            "paperless_calls": {f"{method} {endpoint}": count for (method, endpoint), count in sorted(self.paperless_calls.items())},
+            "ollama_calls": dict(sorted(self.ollama_calls.items())),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if self.latencies:
+            result.update({
+                "count": len(self.latencies),
+                "per_second": round(len(self.latencies) / self.seconds, 2),
+                "latency_p50_ms": round(percentile(self.latencies, 0.50) * 1000, 1),
+                "latency_p95_ms": round(percentile(self.latencies, 0.95) * 1000, 1),
+                "latency_p99_ms": round(percentile(self.latencies, 0.99) * 1000, 1),
+            })
+        if self.python_peak_mb is not None:
+            result["python_peak_mb"] = self.python_peak_mb
+        return result
+
+def configure(paperless: FakePaperless, ollama: FakeOllama, args):
+    """ Point the app at the fakes, must run before any module of src is imported """
+    os.environ.update({
+        "API_BASE": paperless.url,
+        "API_TOKEN": "benchmark",
+        "OLLAMA_HOST": ollama.url,
+        "DATA_DIRECTORY": tempfile.mkdtemp(prefix="paperless-ollama-bench-"),
+        "LLM_CACHE_ENABLED": "true" if args.cache else "false",
+        "TITLE_FEATURE_ENABLED": "true",
+        "CORRESPONDENT_FEATURE_ENABLED": "true",
+        "DOCUMENT_TYPE_FEATURE_ENABLED": "true",
+        "TAX_REPORT_RELEVANCE_FEATURE_ENABLED": "true",
+        "SYNC_TTL_SECONDS": "3600",
+        "LOG_LEVEL": "WARNING",
+    })
+    sys.path.insert(0, SRC)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=1000, help="correspondents and tags each")
+    parser.add_argument("--documents", type=int, default=1000, help="documents in Paperless")
+    parser.add_argument("--identify", type=int, default=100, help="documents to identify")
+    parser.add_argument("--concurrency", type=int, default=1, help="documents identified at once")
+    parser.add_argument("--generate-latency-ms", type=float, default=0)
+    parser.add_argument("--embed-latency-ms", type=float, default=0)
+    parser.add_argument("--paperless-latency-ms", type=float, default=0)
+    parser.add_argument("--cache", action="store_true", help="enable the LLM result cache")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the Python heap peak (slower)")
+    args = parser.parse_args()
+
+    paperless = FakePaperless(latency=args.paperless_latency_ms / 1000).start()
+    ollama = FakeOllama(generate_latency=args.generate_latency_ms / 1000, embed_latency=args.embed_latency_ms / 1000).start()
+    populate(paperless, args.entities, args.documents)
+    configure(paperless, ollama, args)
+
+    import logging
+    from logger import setup_logging
+    setup_logging()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    import functions
+    from paperless import get_document
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    def phase(name: str) -> Phase:
+        return Phase(name, paperless, ollama, args.trace_memory)
+
+    reports = []
+    for name, sync in (
+        ("sync_correspondents", functions.sync_correspondents),
+        ("sync_document_types", functions.sync_document_types),
+        ("sync_tags", functions.sync_tags),
+        ("sync_documents", functions.sync_documents),
+        ("sync_correspondents_unchanged", functions.sync_correspondents),
+    ):
+        with phase(name) as measured:
+            sync()
+        reports.append(measured.report())
+
+    def identify(document_id: int) -> float:
+        start = time.perf_counter()
+        functions.identify_and_update_document(get_document(document_id))
+        return time.perf_counter() - start
+
+    document_ids = list(range(1, min(args.identify, args.documents) + 1))
+    with phase("identify") as measured:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            measured.latencies = list(pool.map(identify, document_ids))
+    reports.append(measured.report())
+
+    for report in reports:
+        print(json.dumps(report, ensure_ascii=False))
+
+    paperless.stop()
+    ollama.stop()
+
+if __name__ == "__main__":
+    main()
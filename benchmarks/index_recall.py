@@ -0,0 +1,134 @@
+"""Recall versus query latency of the HNSW index for different index settings.
+
+Every combination of space, M and ef_construction is built into a scratch ChromaDB
+store from the same embeddings (with reindex.copy_collection, no Ollama calls), then
+queried at every ef_search. Recall@k is measured against the exact neighbours computed
+with NumPy in the same space, so the table shows what a faster or smaller index costs.
+A loaded index keeps the ef_search it was opened with, so every ef_search is queried
+from a fresh process.
+
+From the documents collection of a running installation (read only, the store is copied):
+
+    DATA_DIRECTORY=/path/to/data python benchmarks/index_recall.py --collection documents
+
+From synthetic clustered embeddings:
+
+    python benchmarks/index_recall.py --synthetic 20000 --dimensions 768 --m 16 32 --ef-search 10 50 100 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+from harness import percentile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+def synthetic_embeddings(count: int, dimensions: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """ Unit vectors around random centers, like embeddings of an archive with recurring senders """
+    generator = np.random.default_rng(seed)
+    centers = generator.normal(size=(clusters, dimensions))
+    vectors = centers[generator.integers(0, clusters, count)] + 0.6 * generator.normal(size=(count, dimensions))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def measure(path: str, name: str, k: int):
+    """ Query a built collection with the saved queries, runs in its own process """
+    import chromadb
+    collection = chromadb.PersistentClient(path=path).get_collection(name)
+    queries = np.load(os.path.join(path, "queries.npy"))
+    with open(os.path.join(path, f"exact_{name.split('_')[0]}.json")) as file:
+        exact_ids = json.load(file)
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, exact_ids):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(set(expected) & set(result["ids"][0])) / k)
+    print(json.dumps({
+        "recall": round(float(np.mean(recalls)), 4),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+    }))
+
+def main():
+    if sys.argv[1:2] == ["--measure"]:
+        measure(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="documents", help="collection of DATA_DIRECTORY to read the embeddings from")
+    parser.add_argument("--synthetic", type=int, default=None, help="use N synthetic embeddings instead")
+    parser.add_argument("--dimensions", type=int, default=256, help="size of the synthetic embeddings")
+    parser.add_argument("--clusters", type=int, default=200, help="clusters of the synthetic embeddings")
+    parser.add_argument("--queries", type=int, default=200, help="embeddings held out and used as queries")
+    parser.add_argument("--k", type=int, default=10, help="neighbours per query")
+    parser.add_argument("--space", nargs="+", default=["l2", "cosine"], choices=["l2", "cosine", "ip"])
+    parser.add_argument("--m", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[10, 25, 50, 100, 200])
+    args = parser.parse_args()
+
+    sys.path.insert(0, SRC)
+    import chromadb
+    from chroma import get_client
+    from name_index import space_distances
+    from reindex import copy_collection
+
+    if args.synthetic:
+        embeddings = synthetic_embeddings(args.synthetic + args.queries, args.dimensions, args.clusters)
+        ids = [str(i) for i in range(len(embeddings))]
+    else:
+        stored = get_client().get_collection(args.collection).get(include=["embeddings"])
+        ids = stored["ids"]
+        embeddings = np.asarray(stored["embeddings"], dtype=np.float32)
+    order = np.random.default_rng(1).permutation(len(ids))
+    queries = embeddings[order[:args.queries]]
+    indexed = order[args.queries:]
+    ids = [ids[i] for i in indexed]
+    embeddings = embeddings[indexed]
+
+    path = tempfile.mkdtemp(prefix="paperless-ollama-bench-")
+    np.save(os.path.join(path, "queries.npy"), queries)
+    scratch = chromadb.PersistentClient(path=path)
+    source = scratch.create_collection("source")
+    for start in range(0, len(ids), 1000):
+        source.add(ids=ids[start:start + 1000], embeddings=embeddings[start:start + 1000].tolist())
+    print(json.dumps({"indexed": len(ids), "queries": len(queries), "dimensions": int(embeddings.shape[1]), "k": args.k}))
+
+    for space in args.space:
+        exact = [np.argsort(space_distances(embeddings, query, space), kind="stable")[:args.k] for query in queries]
+        with open(os.path.join(path, f"exact_{space}.json"), "w") as file:
+            json.dump([[ids[i] for i in neighbours] for neighbours in exact], file)
+        for m in args.m:
+            for ef_construction in args.ef_construction:
+                name = f"{space}_m{m}_efc{ef_construction}"
+                start = time.perf_counter()
+                collection = scratch.create_collection(name, configuration={
+                    "hnsw": {"space": space, "max_neighbors": m, "ef_construction": ef_construction, "ef_search": max(args.ef_search)}
+                })
+                copy_collection(source, collection)
+                build_seconds = time.perf_counter() - start
+                for ef_search in args.ef_search:
+                    collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+                    output = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), "--measure", path, name, str(args.k)],
+                        capture_output=True, text=True, check=True
+                    ).stdout
+                    print(json.dumps({
+                        "space": space,
+                        "m": m,
+                        "ef_construction": ef_construction,
+                        "ef_search": ef_search,
+                        "build_seconds": round(build_seconds, 2),
+                        **json.loads(output.strip().splitlines()[-1]),
+                    }))
+                scratch.delete_collection(name)
+
+if __name__ == "__main__":
+    main()
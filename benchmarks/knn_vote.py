@@ -0,0 +1,144 @@
+"""Leave-one-out evaluation of the kNN vote on correspondent and document type.
+
+Every document of the archive is classified by the vote of its nearest stored
+neighbours, itself left out, and compared with the correspondent and document type
+it has in Paperless. For each confidence threshold the report shows the share of
+documents whose LLM call the vote would replace (coverage) and how often the
+replaced answer is right (accuracy), plus the latency of the query and the vote.
+
+Against the vector store of a running installation (only reads it):
+
+    DATA_DIRECTORY=/path/to/data python benchmarks/knn_vote.py --limit 500
+
+Against a synthetic archive built with the deterministic fake embeddings of fakes.py:
+
+    python benchmarks/knn_vote.py --synthetic 2000 --correspondents 50
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from fakes import FakePaperless
+from fakes import fake_embedding
+from fakes import populate
+from harness import percentile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+def build_synthetic(collection, documents: int, correspondents: int, dimensions: int):
+    """ Index synthetic documents the way sync_documents stores them """
+    from chunking import chunk_id
+    from chunking import chunk_text
+
+    paperless = FakePaperless()
+    populate(paperless, correspondents, documents, recurring=True)
+    ids, embeddings, metadatas = [], [], []
+    for document in paperless.store["documents"].values():
+        for index, chunk in enumerate(chunk_text(document["content"])):
+            ids.append(chunk_id(document["id"], index))
+            embeddings.append(fake_embedding(chunk, dimensions))
+            metadatas.append({
+                "parent_id": str(document["id"]),
+                "chunk": index,
+                "title": document["title"],
+                "correspondent_id": str(document["correspondent"]),
+                "document_type_id": str(document["document_type"]),
+            })
+    for start in range(0, len(ids), 1000):
+        collection.upsert(
+            ids=ids[start:start + 1000],
+            embeddings=embeddings[start:start + 1000],
+            metadatas=metadatas[start:start + 1000]
+        )
+    paperless.httpd.server_close()
+
+def stored_documents(collection, limit: int) -> dict:
+    """ Chunk embeddings and metadata per parent document """
+    stored = collection.get(include=["metadatas", "embeddings"])
+    documents = {}
+    for metadata, embedding in zip(stored["metadatas"], stored["embeddings"]):
+        if not metadata or "parent_id" not in metadata:
+            continue
+        entry = documents.setdefault(metadata["parent_id"], {"metadata": metadata, "embeddings": []})
+        entry["embeddings"].append(list(embedding))
+    return dict(list(documents.items())[:limit] if limit else documents.items())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=None, help="only classify the first N documents")
+    parser.add_argument("--synthetic", type=int, default=None, help="build a synthetic archive with N documents")
+    parser.add_argument("--correspondents", type=int, default=50, help="correspondents of the synthetic archive")
+    parser.add_argument("--dimensions", type=int, default=256, help="fake embedding size of the synthetic archive")
+    parser.add_argument("--neighbours", type=int, default=None, help="k, defaults to KNN_NEIGHBOURS")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0])
+    args = parser.parse_args()
+
+    if args.synthetic:
+        os.environ["DATA_DIRECTORY"] = tempfile.mkdtemp(prefix="paperless-ollama-bench-")
+    sys.path.insert(0, SRC)
+    from config import Config
+    from chroma import get_documents_collection
+    from knn import FIELDS
+    from knn import is_confident
+    from knn import neighbours
+    from knn import query_size
+    from knn import vote
+
+    collection = get_documents_collection()
+    if args.synthetic:
+        build_synthetic(collection, args.synthetic, args.correspondents, args.dimensions)
+    documents = stored_documents(collection, args.limit)
+    k = args.neighbours or Config.KNN_NEIGHBOURS
+
+    query_seconds = []
+    vote_seconds = {field: [] for field in FIELDS}
+    outcomes = {field: [] for field in FIELDS}
+    for parent_id, document in documents.items():
+        start = time.perf_counter()
+        matches = collection.query(
+            query_embeddings=document["embeddings"],
+            n_results=query_size(k),
+            include=["metadatas", "distances"]
+        )
+        metadatas, distances = neighbours(matches, exclude_id=parent_id, k=k)
+        within = distances <= Config.KNN_MAXIMUM_DISTANCE
+        metadatas = [metadata for metadata, keep in zip(metadatas, within) if keep]
+        query_seconds.append(time.perf_counter() - start)
+        for field, key in FIELDS.items():
+            start = time.perf_counter()
+            label, confidence, support = vote([metadata.get(key) for metadata in metadatas], distances[within])
+            vote_seconds[field].append(time.perf_counter() - start)
+            expected = document["metadata"].get(key)
+            if expected not in (None, "None"):
+                outcomes[field].append((label, confidence, support, label == expected))
+
+    print(json.dumps({
+        "documents": len(documents),
+        "neighbours": k,
+        "maximum_distance": Config.KNN_MAXIMUM_DISTANCE,
+        "minimum_votes": Config.KNN_MINIMUM_VOTES,
+        "query_p50_ms": round(percentile(query_seconds, 0.50) * 1000, 2),
+        "query_p95_ms": round(percentile(query_seconds, 0.95) * 1000, 2),
+    }))
+    for field, results in outcomes.items():
+        print(json.dumps({
+            "field": field,
+            "labelled": len(results),
+            "top_vote_accuracy": round(sum(correct for *_, correct in results) / len(results), 3) if results else None,
+            "vote_p50_ms": round(percentile(vote_seconds[field], 0.50) * 1000, 3),
+            "vote_p95_ms": round(percentile(vote_seconds[field], 0.95) * 1000, 3),
+        }))
+        for threshold in args.thresholds:
+            confident = [correct for label, confidence, support, correct in results if is_confident(label, confidence, support, threshold)]
+            print(json.dumps({
+                "field": field,
+                "threshold": threshold,
+                "coverage": round(len(confident) / len(results), 3) if results else None,
+                "accuracy": round(sum(confident) / len(confident), 3) if confident else None,
+            }))
+
+if __name__ == "__main__":
+    main()
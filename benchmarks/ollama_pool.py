@@ -0,0 +1,83 @@
+"""Load-balancing and failover of the Ollama host pool against local fake Ollama servers.
+
+Starts one fake Ollama per given latency and sends generate requests through the
+pool from several threads. Halfway through, the first host starts failing with 503
+for --outage seconds. The report shows requests per host, errors seen by the callers,
+throughput, latency percentiles and the pool statistics.
+
+    python benchmarks/ollama_pool.py --latencies-ms 50 50 200 --requests 400 --concurrency 12
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import FakeOllama
+from harness import percentile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latencies-ms", type=float, nargs="+", default=[50, 50, 200], help="one fake host per latency")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--outage", type=float, default=2.0, help="seconds the first host fails, 0 for none")
+    args = parser.parse_args()
+
+    hosts = [FakeOllama(generate_latency=latency / 1000).start() for latency in args.latencies_ms]
+    os.environ.update({
+        "OLLAMA_LLM_HOSTS": ",".join(host.url for host in hosts),
+        "DATA_DIRECTORY": tempfile.mkdtemp(prefix="paperless-ollama-bench-"),
+        "LLM_CACHE_ENABLED": "false",
+        "OLLAMA_HOST_EVICTION_SECONDS": str(args.outage / 2 or 1),
+        "OLLAMA_HEALTH_CHECK_SECONDS": "0.5",
+        "LOG_LEVEL": "ERROR",
+    })
+    sys.path.insert(0, SRC)
+    import llm
+
+    def outage():
+        time.sleep(args.outage)
+        hosts[0].failing = True
+        time.sleep(args.outage)
+        hosts[0].failing = False
+
+    errors = []
+    def request(i: int) -> float:
+        start = time.perf_counter()
+        try:
+            llm.generate(model="benchmark", prompt=f"<DOCUMENT>Rechnung {i}</DOCUMENT>", format={"title": "DocumentTitel", "properties": {"titel": {"type": "string"}}})
+        except Exception as e:
+            errors.append(str(e))
+        return time.perf_counter() - start
+
+    if args.outage:
+        threading.Thread(target=outage, daemon=True).start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(request, range(args.requests)))
+    seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        "requests": args.requests,
+        "seconds": round(seconds, 3),
+        "per_second": round(args.requests / seconds, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "caller_errors": len(errors),
+        "served_per_host": {host.url: host.calls["generate"] for host in hosts},
+        "failed_per_host": {host.url: host.calls["failed"] for host in hosts},
+    }))
+    print(json.dumps(llm.pool_stats()["generate"]))
+    for host in hosts:
+        host.stop()
+
+if __name__ == "__main__":
+    main()
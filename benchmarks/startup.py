@@ -0,0 +1,55 @@
+"""Measure import time of the app and the time until the vector store is warm.
+
+Every measurement runs in a fresh interpreter so module caches do not hide the cost.
+
+    python benchmarks/startup.py --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+import sys
+loaded = {name: name in sys.modules for name in ("chromadb", "ollama")}
+from functions import warm_up
+warm_up()
+print(json.dumps({"import_s": imported, "ready_s": time.perf_counter() - start, "loaded_at_import": loaded}))
+"""
+
+def measure(data_directory: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=SRC,
+        env={**os.environ, "DATA_DIRECTORY": data_directory},
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    data_directory = tempfile.mkdtemp(prefix="paperless-ollama-bench-")
+    results = [measure(data_directory) for _ in range(args.runs)]
+    print(json.dumps({
+        "runs": args.runs,
+        "import_median_s": round(statistics.median(r["import_s"] for r in results), 3),
+        "ready_median_s": round(statistics.median(r["ready_s"] for r in results), 3),
+        "loaded_at_import": results[-1]["loaded_at_import"],
+    }))
+
+if __name__ == "__main__":
+    main()
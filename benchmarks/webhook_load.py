@@ -0,0 +1,69 @@
+"""Measure how many concurrent webhooks a running server accepts.
+
+Sends POST /identify/<id> requests from a number of concurrent clients against a
+server started in production mode and reports throughput, latency percentiles and
+errors. Only the enqueue path is measured, identification happens in the job workers.
+
+    cd src && gunicorn -c gunicorn.conf.py main:app
+    python benchmarks/webhook_load.py http://localhost:5001 --concurrency 1 8 32 128
+"""
+import json
+import time
+import argparse
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+_local = threading.local()
+
+def session() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+def send(url: str, document_id: int, timeout: float):
+    start = time.perf_counter()
+    try:
+        response = session().post(f"{url}/identify/{document_id}", timeout=timeout)
+        ok = response.status_code == 202
+    except requests.RequestException:
+        ok = False
+    return ok, time.perf_counter() - start
+
+def percentile(values: list, fraction: float) -> float:
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+def run(url: str, concurrency: int, requests_per_client: int, first_id: int, timeout: float) -> dict:
+    total = concurrency * requests_per_client
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: send(url, first_id + i, timeout), range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for ok, latency in results if ok)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": total - len(latencies),
+        "requests_per_second": round(total / elapsed, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url", help="base URL of the server")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=50, help="requests per client")
+    parser.add_argument("--first-id", type=int, default=1, help="document id of the first webhook")
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        print(json.dumps(run(args.url.rstrip("/"), concurrency, args.requests, args.first_id, args.timeout)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import logging
+
+from itertools import batched
+
+from llm import embed
+from config import Config
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+def embed_and_upsert(collection, items, text, metadata, batch_size: int = None, known_embeddings: dict = None):
+    """ Embed items with one embed call per batch and write each batch with one upsert """
+    batch_size = batch_size or Config.EMBED_BATCH_SIZE
+    known_embeddings = known_embeddings or {}
+    count = 0
+    for batch in batched(items, batch_size):
+        _embed_and_upsert_batch(collection, list(batch), text, metadata, known_embeddings)
+        count += len(batch)
+    return count
+
+def _embed_and_upsert_batch(collection, batch: list, text, metadata, known_embeddings: dict):
+    try:
+        ids = [str(item["id"]) for item in batch]
+        to_embed = [item for item in batch if str(item["id"]) not in known_embeddings]
+        if to_embed:
+            logger.info(f"Embedding batch of {len(to_embed)} items for '{collection.name}'.")
+            embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=[text(item) for item in to_embed])
+            generated = dict(zip((str(item["id"]) for item in to_embed), embedding_response["embeddings"]))
+        else:
+            generated = {}
+        with timed("chroma_upsert"):
+            collection.upsert(
+                documents=[text(item) for item in batch],
+                ids=ids,
+                metadatas=[metadata(item) for item in batch],
+                embeddings=[known_embeddings[id] if id in known_embeddings else generated[id] for id in ids]
+            )
+    except Exception as e:
+        if len(batch) == 1:
+            raise
+        # Split the batch in halves so a single bad item only fails its own call
+        half = len(batch) // 2
+        logger.warning(f"Batch of {len(batch)} items for '{collection.name}' failed ({e}), retrying in smaller batches.")
+        _embed_and_upsert_batch(collection, batch[:half], text, metadata, known_embeddings)
+        _embed_and_upsert_batch(collection, batch[half:], text, metadata, known_embeddings)
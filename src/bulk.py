@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+
+from itertools import batched
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from paperless import get_documents
+from paperless import count_documents
+from functions import identify_and_update_document
+from functions import ensure_metadata_synced
+from functions import sync_documents
+from functions import STAGES_PER_DOCUMENT
+from jobs import exclusive_job
+
+logger = logging.getLogger(__name__)
+
+# Runs started by this process, with several web workers the others only see their checkpoints
+runs = {}
+_runs_lock = threading.Lock()
+
+def build_filters(ids: list = None, tag_id: int = None, created_from: str = None, created_to: str = None) -> dict:
+    """ Translate the bulk selection into Paperless document filter parameters """
+    filters = {"ordering": "id"}
+    if ids:
+        filters["id__in"] = ",".join(str(id) for id in ids)
+    if tag_id:
+        filters["tags__id__all"] = str(tag_id)
+    if created_from:
+        filters["created__date__gte"] = created_from
+    if created_to:
+        filters["created__date__lte"] = created_to
+    return filters
+
+class BulkRun:
+    """ Streams a filtered document range through the pipeline and checkpoints after every batch """
+
+    def __init__(
+            self,
+            filters: dict,
+            concurrency: int = None,
+            batch_size: int = None,
+            run_id: str = None,
+            force: bool = False
+        ):
+        self.id = run_id or uuid.uuid4().hex
+        self.filters = filters
+        self.concurrency = concurrency or Config.BULK_CONCURRENCY
+        self.batch_size = batch_size or Config.BULK_BATCH_SIZE
+        self.force = force
+        self.checkpoint_path = os.path.join(Config.BULK_CHECKPOINT_DIRECTORY, f"{self.id}.json")
+        self.status = "created"
+        self.last_id = None
+        self.processed = 0
+        self.skipped = 0
+        self.failed = {}
+        self.total = None
+        self.started_at = None
+        self.finished_at = None
+        self._processed_at_start = 0
+        self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint["filters"] != self.filters:
+            raise ValueError(f"Checkpoint {self.checkpoint_path} was written for different filters")
+        self.last_id = checkpoint["last_id"]
+        self.processed = checkpoint["processed"]
+        self.skipped = checkpoint.get("skipped", 0)
+        self.failed = checkpoint["failed"]
+        logger.info(f"Resuming bulk run {self.id} after document {self.last_id} ({self.processed} processed).")
+
+    def _save_checkpoint(self):
+        os.makedirs(Config.BULK_CHECKPOINT_DIRECTORY, exist_ok=True)
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "filters": self.filters,
+                "status": self.status,
+                "total": self.total,
+                "last_id": self.last_id,
+                "processed": self.processed,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "saved_at": time.time()
+            }, f)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def _remaining_filters(self) -> dict:
+        if self.last_id is None:
+            return self.filters
+        return {**self.filters, "id__gt": str(self.last_id)}
+
+    def progress(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0
+        throughput = (self.processed - self._processed_at_start) / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.processed, 0) if self.total is not None else None
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "failed": len(self.failed),
+            "last_id": self.last_id,
+            "documents_per_minute": round(throughput * 60, 2),
+            "eta_seconds": round(remaining / throughput) if remaining is not None and throughput > 0 else None
+        }
+
+    def _process(self, document, stage_pool):
+        try:
+            # Webhook jobs for the same document wait until this one is done
+            with exclusive_job(document["id"]):
+                updated_document = identify_and_update_document(
+                    document, sync=False, force=self.force, stage_pool=stage_pool
+                )
+            return document["id"], updated_document is None, None
+        except Exception as e:
+            logger.exception(f"Bulk run {self.id}: document {document['id']} failed.")
+            return document["id"], False, str(e)
+
+    def is_active(self) -> bool:
+        return self.status in ("created", "running")
+
+    def run(self):
+        self.status = "running"
+        self.started_at = time.time()
+        self._processed_at_start = self.processed
+        try:
+            self.total = self.processed + count_documents(self._remaining_filters())
+        except Exception:
+            self.status = "failed"
+            raise
+        logger.info(f"Bulk run {self.id}: {self.total} documents, concurrency {self.concurrency}.")
+        self._save_checkpoint()
+
+        try:
+            # The stages get a pool of their own, the shared one is sized for the job workers only
+            with (
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"bulk-{self.id[:8]}") as pool,
+                ThreadPoolExecutor(
+                    max_workers=STAGES_PER_DOCUMENT * self.concurrency, thread_name_prefix=f"bulk-stage-{self.id[:8]}"
+                ) as stage_pool
+            ):
+                for batch in batched(get_documents(filters=self._remaining_filters()), self.batch_size):
+                    # Only the entity catalogs, listing every document per batch would make the run quadratic
+                    ensure_metadata_synced(force=True)
+                    for document_id, skipped, error in pool.map(lambda document: self._process(document, stage_pool), batch):
+                        if error:
+                            self.failed[str(document_id)] = error
+                        self.skipped += skipped
+                        self.processed += 1
+                    # Documents come in id order, so the last id of a finished batch is a safe resume point
+                    self.last_id = batch[-1]["id"]
+                    sync_documents()
+                    self._save_checkpoint()
+                    logger.info(f"Bulk run progress: {self.progress()}")
+            self.status = "done"
+        except Exception:
+            logger.exception(f"Bulk run {self.id} aborted.")
+            self.status = "failed"
+            raise
+        finally:
+            self.finished_at = time.time()
+            self._save_checkpoint()
+        return self.progress()
+
+def start_run(filters: dict, concurrency: int = None, run_id: str = None, force: bool = False) -> BulkRun:
+    """ Start a run in the background, a run that is still active in this process is returned as it is """
+    with _runs_lock:
+        if run_id in runs and runs[run_id].is_active():
+            logger.info(f"Bulk run {run_id} is still running, not starting it again.")
+            return runs[run_id]
+        run = BulkRun(filters, concurrency=concurrency, run_id=run_id, force=force)
+        runs[run.id] = run
+    threading.Thread(target=run.run, name=f"bulk-{run.id[:8]}", daemon=True).start()
+    return run
+
+def get_progress(run_id: str) -> dict:
+    """ Progress of a run of this process, or as of the last checkpoint of a run started by another worker """
+    if run_id in runs:
+        return runs[run_id].progress()
+    checkpoint_path = os.path.join(Config.BULK_CHECKPOINT_DIRECTORY, f"{run_id}.json")
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    return {
+        "id": run_id,
+        "status": checkpoint.get("status"),
+        "total": checkpoint.get("total"),
+        "processed": checkpoint["processed"],
+        "skipped": checkpoint.get("skipped", 0),
+        "failed": len(checkpoint["failed"]),
+        "last_id": checkpoint["last_id"],
+        "documents_per_minute": None,
+        "eta_seconds": None,
+        "saved_at": checkpoint.get("saved_at")
+    }
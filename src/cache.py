@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from contextlib import closing
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_initialized = False
+_counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+def _connect():
+    os.makedirs(os.path.dirname(Config.LLM_CACHE_DATABASE) or ".", exist_ok=True)
+    connection = sqlite3.connect(Config.LLM_CACHE_DATABASE, timeout=30, isolation_level=None)
+    return closing(connection)
+
+def _init(connection):
+    global _initialized
+    if _initialized:
+        return
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            model TEXT NOT NULL,
+            value TEXT NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+    """)
+    connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+    # Results are only valid for the model that produced them
+    configured_models = (Config.OLLAMA_LLM_MODEL, Config.OLLAMA_EMBEDDING_MODEL)
+    purged = connection.execute(
+        "DELETE FROM entries WHERE model NOT IN (?, ?)", configured_models
+    ).rowcount
+    if purged:
+        logger.info(f"Purged {purged} cache entries of models that are no longer configured.")
+    _initialized = True
+
+def make_key(kind: str, model: str, **parts) -> str:
+    payload = json.dumps({"kind": kind, "model": model, **parts}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_many(keys: list) -> dict:
+    if not Config.LLM_CACHE_ENABLED or not keys:
+        return {}
+    with _lock, _connect() as connection:
+        _init(connection)
+        placeholders = ",".join("?" * len(keys))
+        rows = connection.execute(f"SELECT key, value FROM entries WHERE key IN ({placeholders})", keys).fetchall()
+        found = {key: json.loads(value) for key, value in rows}
+        if found:
+            connection.execute(
+                f"UPDATE entries SET accessed_at = ? WHERE key IN ({','.join('?' * len(found))})",
+                (time.time(), *found.keys())
+            )
+        _counters["hits"] += len(found)
+        _counters["misses"] += len(keys) - len(found)
+    return found
+
+def get(key: str):
+    return get_many([key]).get(key)
+
+def put_many(kind: str, model: str, values: dict):
+    if not Config.LLM_CACHE_ENABLED or not values:
+        return
+    now = time.time()
+    with _lock, _connect() as connection:
+        _init(connection)
+        connection.executemany(
+            "INSERT OR REPLACE INTO entries (key, kind, model, value, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            [(key, kind, model, json.dumps(value), now) for key, value in values.items()]
+        )
+        # Least recently used entries are evicted once the cache is over its size bound
+        excess = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - Config.LLM_CACHE_MAX_ENTRIES
+        if excess > 0:
+            connection.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at LIMIT ?)", (excess,)
+            )
+            _counters["evictions"] += excess
+
+def put(kind: str, model: str, key: str, value):
+    put_many(kind, model, {key: value})
+
+def stats() -> dict:
+    entries = 0
+    if Config.LLM_CACHE_ENABLED and os.path.exists(Config.LLM_CACHE_DATABASE):
+        with _lock, _connect() as connection:
+            _init(connection)
+            entries = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    return {**_counters, "entries": entries, "enabled": Config.LLM_CACHE_ENABLED}
@@ -1,13 +1,104 @@
 import logging
-import chromadb
+import threading
 
 from config import Config
 
 logger = logging.getLogger(__name__)
 
-client = chromadb.PersistentClient(path=Config.CHROMA_DATA_DIR)
+COLLECTION_NAMES = ("correspondents", "document_types", "documents", "tags")
+# Every id of a get is a SQL variable, SQLite allows 32766 of them per statement
+PAGE_SIZE = 5000
 
-correspondents_collection = client.get_or_create_collection("correspondents")
-document_types_collection = client.get_or_create_collection("document_types")
-documents_collection = client.get_or_create_collection("documents")
-tags_collection = client.get_or_create_collection("tags")
\ No newline at end of file
+# The client and its collections are created on first use, importing chromadb and
+# opening the store takes longer than everything else at startup
+_lock = threading.RLock()
+_client = None
+_collections = {}
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import chromadb
+                _client = chromadb.PersistentClient(path=Config.CHROMA_DATA_DIR)
+                logger.info(f"Opened ChromaDB store at '{Config.CHROMA_DATA_DIR}'.")
+    return _client
+
+def index_configuration(name: str, **overrides) -> dict:
+    """ HNSW configuration of a collection from Config.COLLECTIONS, overrides replace single values """
+    settings = {**Config.COLLECTIONS[name], **overrides}
+    return {"hnsw": {key: settings[key] for key in ("space", "max_neighbors", "ef_construction", "ef_search")}}
+
+def hnsw_configuration(collection) -> dict:
+    return (collection.configuration or {}).get("hnsw") or {}
+
+def space_of(collection) -> str:
+    """ Distance space a collection was built with """
+    return hnsw_configuration(collection).get("space") or "l2"
+
+def _apply_configuration(name: str, collection):
+    """ Update ef_search in place, the settings fixed at build time only get a warning
+
+    Runs before the first query loads the index, a loaded index keeps its ef_search until restart.
+    """
+    built = hnsw_configuration(collection)
+    wanted = index_configuration(name)["hnsw"]
+    if built.get("ef_search") != wanted["ef_search"]:
+        collection.modify(configuration={"hnsw": {"ef_search": wanted["ef_search"]}})
+        logger.info(f"Set ef_search of collection '{name}' to {wanted['ef_search']}.")
+    differing = {key: built.get(key) for key in ("space", "max_neighbors", "ef_construction") if built.get(key) != wanted[key]}
+    if differing:
+        logger.warning(
+            f"Collection '{name}' was built with {differing} instead of the configured values, "
+            f"run 'python reindex.py {name} --swap' while the service is stopped to rebuild it."
+        )
+
+def get_collection(name: str):
+    collection = _collections.get(name)
+    if collection is None:
+        with _lock:
+            collection = _collections.get(name)
+            if collection is None:
+                collection = get_client().get_or_create_collection(name, configuration=index_configuration(name))
+                _apply_configuration(name, collection)
+                _collections[name] = collection
+    return collection
+
+def get_correspondents_collection():
+    return get_collection("correspondents")
+
+def get_document_types_collection():
+    return get_collection("document_types")
+
+def get_documents_collection():
+    return get_collection("documents")
+
+def get_tags_collection():
+    return get_collection("tags")
+
+def get_pages(collection, include: list, where: dict = None, page_size: int = PAGE_SIZE):
+    """ Read all entries of a collection, or those matching where, page by page """
+    offset = 0
+    while True:
+        page = collection.get(include=include, where=where, limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+def delete_ids(collection, ids: list):
+    """ Delete entries in batches, ChromaDB rejects a write with more ids than its max batch size """
+    batch_size = get_client().get_max_batch_size()
+    for start in range(0, len(ids), batch_size):
+        collection.delete(ids=ids[start:start + batch_size])
+
+def update_metadatas(collection, ids: list, metadatas: list):
+    """ Update metadatas in batches of the client's max batch size """
+    batch_size = get_client().get_max_batch_size()
+    for start in range(0, len(ids), batch_size):
+        collection.update(ids=ids[start:start + batch_size], metadatas=metadatas[start:start + batch_size])
+
+def is_open() -> bool:
+    """ Whether the store and all collections have been opened in this process """
+    return _client is not None and all(name in _collections for name in COLLECTION_NAMES)
@@ -0,0 +1,87 @@
+from itertools import batched
+
+from config import Config
+from chroma import get_pages
+
+def chunk_text(text: str, size: int = None, overlap: int = None, max_chunks: int = None) -> list:
+    """ Split text into overlapping windows, evenly sampled down to at most max_chunks """
+    size = size or Config.CHUNK_SIZE
+    overlap = Config.CHUNK_OVERLAP if overlap is None else overlap
+    max_chunks = max_chunks or Config.MAX_CHUNKS_PER_DOCUMENT
+    text = text or ""
+    if len(text) <= size:
+        return [text]
+
+    step = max(size - overlap, 1)
+    starts = list(range(0, len(text) - overlap, step))
+    if len(starts) > max_chunks:
+        # Keep the first and last window, they usually hold sender and totals
+        last = len(starts) - 1
+        starts = [starts[round(i * last / (max_chunks - 1))] for i in range(max_chunks)] if max_chunks > 1 else starts[:1]
+
+    chunks = []
+    for start in starts:
+        end = min(start + size, len(text))
+        # Do not cut words in half if there is whitespace near the window end
+        if end < len(text):
+            boundary = text.rfind(" ", start + size - overlap, end)
+            if boundary > start:
+                end = boundary
+        chunks.append(text[start:end])
+    return chunks
+
+def chunk_id(document_id, index: int) -> str:
+    return f"{document_id}#{index}"
+
+# Parent ids per lookup, every id of an $in filter is a SQL variable as well
+LOOKUP_BATCH_SIZE = 500
+
+def _document_pages(collection, parent_ids: list = None):
+    if parent_ids is None:
+        yield from get_pages(collection, include=["metadatas"])
+        return
+    for batch in batched(parent_ids, LOOKUP_BATCH_SIZE):
+        yield from get_pages(collection, include=["metadatas"], where={"parent_id": {"$in": list(batch)}})
+
+def load_document_index(collection, parent_ids: list = None):
+    """ Load the chunk entries of all or of the given parent documents page by page and group them by parent
+
+    Whole-document entries from before chunking are only found without parent_ids.
+    """
+    parents = {}
+    chunk_ids = {}
+    legacy_ids = []
+    for page in _document_pages(collection, parent_ids):
+        for id, metadata in zip(page["ids"], page["metadatas"]):
+            if not metadata or "parent_id" not in metadata:
+                # Whole-document entries from before chunking are replaced by chunks
+                legacy_ids.append(id)
+                continue
+            parent_id = metadata["parent_id"]
+            parents[parent_id] = {key: value for key, value in metadata.items() if key != "chunk"}
+            chunk_ids.setdefault(parent_id, []).append(id)
+    return parents, chunk_ids, legacy_ids
+
+def aggregate_distances(matches: dict) -> list:
+    """ Rank parent documents by their mean best chunk distance over all query chunks
+
+    matches is a chroma query result with one row per query chunk. A parent that did
+    not show up for a query chunk counts with the worst distance of that row.
+    """
+    per_parent = {}
+    metadata_by_parent = {}
+    rows = list(zip(matches["metadatas"], matches["distances"]))
+    for row_index, (metadatas, distances) in enumerate(rows):
+        for metadata, distance in zip(metadatas, distances):
+            parent_id = metadata.get("parent_id", metadata.get("id"))
+            metadata_by_parent.setdefault(parent_id, metadata)
+            best = per_parent.setdefault(parent_id, {})
+            best[row_index] = min(distance, best.get(row_index, distance))
+
+    ranked = []
+    for parent_id, best in per_parent.items():
+        total = 0.0
+        for row_index, (_, distances) in enumerate(rows):
+            total += best.get(row_index, max(distances) if distances else 0.0)
+        ranked.append((metadata_by_parent[parent_id], total / len(rows)))
+    return sorted(ranked, key=lambda x: x[1])
@@ -1,10 +1,25 @@
 import os
 
+def _collection_settings(name: str, maximum_distance: float) -> dict:
+    """ Vector index settings of a collection, CHROMA_<NAME>_* overrides the CHROMA_* default """
+    prefix = f"CHROMA_{name.upper()}_"
+    def setting(key: str, default):
+        return os.environ.get(prefix + key, os.environ.get("CHROMA_" + key, default))
+    return {
+        "space": setting("SPACE", "l2"),
+        "max_neighbors": int(setting("HNSW_M", 16)),
+        "ef_construction": int(setting("HNSW_EF_CONSTRUCTION", 100)),
+        "ef_search": int(setting("HNSW_EF_SEARCH", 100)),
+        # In the unit of the space, squared L2 distance for l2 and 1 - similarity for cosine and ip
+        "maximum_distance": float(os.environ.get(prefix + "MAXIMUM_DISTANCE", maximum_distance)),
+    }
+
 class Config:
     TITLE_FEATURE_ENABLED = os.getenv("TITLE_FEATURE_ENABLED", "false").lower() in ("true", "1", "yes")
     DOCUMENT_TYPE_FEATURE_ENABLED = os.getenv("DOCUMENT_TYPE_FEATURE_ENABLED", "false").lower() in ("true", "1", "yes")
     CORRESPONDENT_FEATURE_ENABLED = os.getenv("CORRESPONDENT_FEATURE_ENABLED", "false").lower() in ("true", "1", "yes")
     TAX_REPORT_RELEVANCE_FEATURE_ENABLED = os.getenv("TAX_REPORT_RELEVANCE_FEATURE_ENABLED", "false").lower() in ("true", "1", "yes")
+    COMBINED_EXTRACTION_ENABLED = os.getenv("COMBINED_EXTRACTION_ENABLED", "false").lower() in ("true", "1", "yes")
 
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 
@@ -19,18 +34,96 @@ class Config:
     CORRESPONDENTS_API_URL = os.path.join(API_BASE, "api/correspondents/")
     DOCUMENT_TYPES_API_URL = os.path.join(API_BASE, "api/document_types/")
     TAGS_API_URL = os.path.join(API_BASE, "api/tags/")
+    PAPERLESS_PAGE_SIZE = int(os.environ.get("PAPERLESS_PAGE_SIZE", 100))
+    PAPERLESS_ID_PAGE_SIZE = int(os.environ.get("PAPERLESS_ID_PAGE_SIZE", 1000))
+    PAPERLESS_POOL_SIZE = int(os.environ.get("PAPERLESS_POOL_SIZE", 10))
+    PAPERLESS_CONNECT_TIMEOUT = float(os.environ.get("PAPERLESS_CONNECT_TIMEOUT", 5))
+    PAPERLESS_READ_TIMEOUT = float(os.environ.get("PAPERLESS_READ_TIMEOUT", 60))
+    PAPERLESS_RETRIES = int(os.environ.get("PAPERLESS_RETRIES", 5))
+    PAPERLESS_BACKOFF_FACTOR = float(os.environ.get("PAPERLESS_BACKOFF_FACTOR", 0.5))
+    PAPERLESS_BACKOFF_JITTER = float(os.environ.get("PAPERLESS_BACKOFF_JITTER", 0.5))
 
     TAG_ID_TO_ADD_AFTER_IDENTIFICATION = os.environ.get("TAG_TO_ADD_AFTER_IDENTIFICATION", 1)
     TAG_TAX_RELEVANT = os.environ.get("TAG_TAX_RELEVANT", "steuer")
 
-    MAXIMUM_MATCHING_DISTANCE = os.environ.get("MAXIMUM_MATCHING_DISTANCE", 0.15)
+    MAXIMUM_MATCHING_DISTANCE = float(os.environ.get("MAXIMUM_MATCHING_DISTANCE", 0.15))
+    # Space, HNSW M, ef_construction and ef_search and the matching threshold per collection.
+    # Space, M and ef_construction are fixed when a collection is built, reindex.py applies changes.
+    COLLECTIONS = {
+        "correspondents": _collection_settings("correspondents", MAXIMUM_MATCHING_DISTANCE),
+        "document_types": _collection_settings("document_types", MAXIMUM_MATCHING_DISTANCE),
+        "documents": _collection_settings("documents", MAXIMUM_MATCHING_DISTANCE),
+        "tags": _collection_settings("tags", MAXIMUM_MATCHING_DISTANCE),
+    }
+    # The near-duplicate and kNN distances are in the space of the documents collection
+    # Opt in with NEAR_DUPLICATE_ENABLED=true: a document almost identical to a stored one takes over its
+    # correspondent, document type, title and tax relevance without asking the LLM
+    NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "false").lower() in ("true", "1", "yes")
+    NEAR_DUPLICATE_MAXIMUM_DISTANCE = float(os.environ.get("NEAR_DUPLICATE_MAXIMUM_DISTANCE", 0.03))
+    # Opt in with KNN_ENABLED=true: correspondent and document type come from a confident vote of the
+    # nearest stored documents instead of the LLM, benchmarks/knn_vote.py shows coverage and accuracy per threshold
+    KNN_ENABLED = os.getenv("KNN_ENABLED", "false").lower() in ("true", "1", "yes")
+    KNN_NEIGHBOURS = int(os.environ.get("KNN_NEIGHBOURS", 10))
+    KNN_MAXIMUM_DISTANCE = float(os.environ.get("KNN_MAXIMUM_DISTANCE", 0.3))
+    KNN_MINIMUM_CONFIDENCE = float(os.environ.get("KNN_MINIMUM_CONFIDENCE", 0.8))
+    KNN_MINIMUM_VOTES = int(os.environ.get("KNN_MINIMUM_VOTES", 3))
+    # Every neighbour can take up to MAX_CHUNKS_PER_DOCUMENT chunk results, this bounds the query
+    KNN_MAXIMUM_CHUNK_RESULTS = int(os.environ.get("KNN_MAXIMUM_CHUNK_RESULTS", 100))
     OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://ollama:11434")
     OLLAMA_LLM_MODEL = os.environ.get("OLLAMA_LLM_MODEL", "gemma3n:e4b")
     OLLAMA_EMBEDDING_MODEL = os.environ.get("OLLAMA_EMBEDDING_MODEL", "embeddinggemma:300m")
+    OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", 4))
+    # Comma separated, both default to OLLAMA_HOST
+    OLLAMA_LLM_HOSTS = [host.strip() for host in os.environ.get("OLLAMA_LLM_HOSTS", OLLAMA_HOST).split(",") if host.strip()]
+    OLLAMA_EMBEDDING_HOSTS = [host.strip() for host in os.environ.get("OLLAMA_EMBEDDING_HOSTS", OLLAMA_HOST).split(",") if host.strip()]
+    OLLAMA_TIMEOUT_SECONDS = float(os.environ.get("OLLAMA_TIMEOUT_SECONDS", 600))
+    OLLAMA_HOST_MAXIMUM_ERRORS = int(os.environ.get("OLLAMA_HOST_MAXIMUM_ERRORS", 1))
+    OLLAMA_HOST_EVICTION_SECONDS = float(os.environ.get("OLLAMA_HOST_EVICTION_SECONDS", 30))
+    OLLAMA_HEALTH_CHECK_SECONDS = float(os.environ.get("OLLAMA_HEALTH_CHECK_SECONDS", 15))
+    OLLAMA_WARM_UP_ENABLED = os.getenv("OLLAMA_WARM_UP_ENABLED", "true").lower() in ("true", "1", "yes")
+    # Duration like "30m" or seconds, -1 keeps the models loaded until Ollama restarts
+    OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "1h")
+    # Comma separated context sizes, empty leaves num_ctx to the model default
+    OLLAMA_NUM_CTX_BUCKETS = [int(size) for size in os.environ.get("OLLAMA_NUM_CTX_BUCKETS", "2048,4096,8192,16384").split(",") if size.strip()]
 
     DATA_DIRECTORY = os.environ.get("DATA_DIRECTORY", "data")
     CHROMA_DATA_DIR = os.path.join(DATA_DIRECTORY, "chroma")
-    
+
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("true", "1", "yes")
+    LLM_CACHE_DATABASE = os.path.join(DATA_DIRECTORY, "llm_cache.sqlite3")
+    LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 50000))
+
+    LEDGER_ENABLED = os.getenv("LEDGER_ENABLED", "true").lower() in ("true", "1", "yes")
+    LEDGER_DATABASE = os.path.join(DATA_DIRECTORY, "ledger.sqlite3")
+
+    JOBS_DATABASE = os.path.join(DATA_DIRECTORY, "jobs.sqlite3")
+    WORKER_COUNT = int(os.environ.get("WORKER_COUNT", 2))
+    JOB_POLL_INTERVAL_SECONDS = float(os.environ.get("JOB_POLL_INTERVAL_SECONDS", 5))
+    # A running job whose process stopped renewing its lease for this long is queued again
+    JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+    WEBHOOK_DEBOUNCE_SECONDS = float(os.environ.get("WEBHOOK_DEBOUNCE_SECONDS", 5))
+
+    WEB_BIND = os.environ.get("WEB_BIND", "0.0.0.0:5001")
+    WEB_WORKERS = int(os.environ.get("WEB_WORKERS", 1))
+    WEB_THREADS = int(os.environ.get("WEB_THREADS", 8))
+    WEB_TIMEOUT_SECONDS = int(os.environ.get("WEB_TIMEOUT_SECONDS", 300))
+    WEB_GRACEFUL_TIMEOUT_SECONDS = int(os.environ.get("WEB_GRACEFUL_TIMEOUT_SECONDS", 600))
+
+    BULK_CONCURRENCY = int(os.environ.get("BULK_CONCURRENCY", 2))
+    BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", 50))
+    BULK_CHECKPOINT_DIRECTORY = os.path.join(DATA_DIRECTORY, "bulk")
+
+    CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 1500))
+    CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", 200))
+    MAX_CHUNKS_PER_DOCUMENT = int(os.environ.get("MAX_CHUNKS_PER_DOCUMENT", 8))
+    SIMILAR_CHUNK_RESULTS = int(os.environ.get("SIMILAR_CHUNK_RESULTS", 20))
+
+    SYNC_TTL_SECONDS = float(os.environ.get("SYNC_TTL_SECONDS", 300))
+    EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 64))
+    DOCUMENT_EMBED_BATCH_SIZE = int(os.environ.get("DOCUMENT_EMBED_BATCH_SIZE", 8))
+
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 512))
+
     CORRESPONDENT_SYSTEM_PROMPT = os.environ.get("CORRESPONDENT_SYSTEM_PROMPT", """You are an expert in identifying who did send a document. 
 
 Instructions (repeat to avoid context loss):
@@ -140,4 +233,43 @@ The relevant tax year is {TAX_YEAR}.
 <DOCUMENT>
 {DOCUMENT_TEXT}
 </DOCUMENT>
-""")
\ No newline at end of file
+""")
+
+    CLASSIFICATION_SYSTEM_PROMPT = os.environ.get("CLASSIFICATION_SYSTEM_PROMPT", """You are an expert in classifying German documents.
+Read the document once and extract all of the following fields.
+
+Fields:
+- titel: A short and meaningful German title. Never "Document". It should not contain the sender name.
+- sender: The official name of the sender. Not the receiver. If the document is sent from a company or organization, return its name instead of a person.
+- document_type: The official German document type.
+- tax_relevant: true if the document could reasonably be required for a private German income tax return (Steuererklärung) for the year {TAX_YEAR}, otherwise false.
+
+Instructions (repeat to avoid context loss):
+- Respond only in JSON format according to the schema.
+- Do not add explanations or any other fields.
+
+<DOCUMENT>
+{DOCUMENT_TEXT}
+</DOCUMENT>
+
+Examples for titel:
+- Rechnung 2023-10-01
+- Gehaltsabrechnung Firma XY 2023-09
+{SIMILAR_DOCUMENT_TITLE}
+
+Examples for sender:
+- Firma XY
+- Finanzamt Musterstadt
+{SIMILAR_CORRESPONDENT_NAME}
+
+Examples for document_type:
+- Rechnung
+- Vertrag
+- Kontoauszug
+{SIMILAR_DOCUMENT_TYPE_NAME}
+
+Instructions (repeat to avoid context loss):
+- Find the sender, not the receiver.
+- Title and document type must be in German.
+- Respond only in JSON format according to the schema.
+""")
@@ -0,0 +1,113 @@
+import re
+import math
+import bisect
+
+from config import Config
+
+# Rough token estimate for German OCR text, good enough to bound the prompt size
+CHARS_PER_TOKEN = 4
+# Paragraphs without line breaks are split so a single block cannot take the whole budget
+MAX_SEGMENT_LENGTH = 300
+GAP = "[...]"
+# Lines below this score carry no signal and are left out even if the budget has room
+MINIMUM_SCORE = 1.0
+
+SIGNALS = (
+    # IBAN and BIC usually sit in the sender's footer
+    (re.compile(r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){3,7}(?: ?[A-Z0-9]{1,4})?\b"), 5),
+    (re.compile(r"\b(?:BIC|Swift)\b", re.IGNORECASE), 2),
+    # Legal forms name the sender
+    (re.compile(r"\b(?:GmbH|mbH|AG|KG|KGaA|OHG|GbR|UG|SE|e\.\s?V\.|e\.\s?K\.|eG|Ltd|Inc)\b"), 4),
+    # Postal code and city, street and house number
+    (re.compile(r"\b\d{5}\s+[A-ZÄÖÜ][a-zäöüß]+"), 3),
+    (re.compile(r"\b[A-ZÄÖÜ][a-zäöüß-]*(?:straße|strasse|str\.|weg|platz|allee|gasse|ring|damm)\s+\d+", re.IGNORECASE), 2),
+    # Dates and amounts
+    (re.compile(r"\b\d{1,2}\.\s?\d{1,2}\.\s?\d{2,4}\b|\b\d{4}-\d{2}-\d{2}\b"), 2),
+    (re.compile(
+        r"\b\d{1,2}\.?\s+(?:Januar|Februar|März|April|Mai|Juni|Juli|August|September|Oktober|November|Dezember)\s+\d{4}\b",
+        re.IGNORECASE
+    ), 2),
+    (re.compile(r"(?:€|\bEUR\b)|\b\d{1,3}(?:\.\d{3})*,\d{2}\b"), 2),
+    # Words that name the kind of document or its subject
+    (re.compile(
+        r"\b(?:Rechnung|Gutschrift|Mahnung|Bescheid|Vertrag|Kündigung|Kontoauszug|Abrechnung|Quittung|Beleg|Angebot|"
+        r"Bestätigung|Versicherung|Steuer\w*|Lohn\w*|Gehalt\w*|Spende\w*|Betreff|Kundennummer|Rechnungsnummer|"
+        r"Vertragsnummer|Aktenzeichen|Steuernummer|Zeitraum|Invoice|Receipt)\b",
+        re.IGNORECASE
+    ), 3),
+)
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def _segments(text: str) -> list:
+    segments = []
+    for line in text.splitlines():
+        line = line.strip()
+        while len(line) > MAX_SEGMENT_LENGTH:
+            cut = line.rfind(" ", 0, MAX_SEGMENT_LENGTH)
+            cut = cut if cut > 0 else MAX_SEGMENT_LENGTH
+            segments.append(line[:cut])
+            line = line[cut:].strip()
+        if line:
+            segments.append(line)
+    return segments
+
+def score_segment(segment: str, position: int, count: int) -> float:
+    """ Value of a line for the prompt by the signals it contains and where it sits """
+    score = sum(weight for pattern, weight in SIGNALS if pattern.search(segment))
+    # Letterheads and footers carry sender, subject and bank details
+    distance_to_edge = min(position, count - 1 - position)
+    score += 3 / (1 + distance_to_edge / 3)
+    # Lines that are mostly symbols or digits are OCR noise or table cells
+    letters = sum(character.isalpha() for character in segment)
+    if letters < 3:
+        score *= 0.2
+    return score
+
+def _join_length(left: int, right: int) -> int:
+    """ Characters between two selected segments, a line break or a gap marker on a line of its own """
+    return 1 if right == left + 1 else len(GAP) + 2
+
+def select_context(text: str, budget: int = None) -> str:
+    """ Pack the most informative lines of a document into a token budget, keeping their order """
+    budget = budget or Config.CONTEXT_TOKEN_BUDGET
+    text = text or ""
+    if estimate_tokens(text) <= budget:
+        return text
+
+    segments = _segments(text)
+    scores = [score_segment(segment, i, len(segments)) for i, segment in enumerate(segments)]
+    # Favour dense lines, a long paragraph has to carry more signals than a short header line
+    ranked = sorted(
+        (i for i in range(len(segments)) if scores[i] >= MINIMUM_SCORE),
+        key=lambda i: scores[i] / max(estimate_tokens(segments[i]), 1) ** 0.5,
+        reverse=True
+    )
+    # Length of the output in characters, a segment also changes the joins to its selected neighbours
+    selected = []
+    length = 0
+    for i in ranked:
+        position = bisect.bisect(selected, i)
+        before = selected[position - 1] if position > 0 else None
+        after = selected[position] if position < len(selected) else None
+        added = len(segments[i])
+        if before is not None:
+            added += _join_length(before, i)
+        if after is not None:
+            added += _join_length(i, after)
+        if before is not None and after is not None:
+            added -= _join_length(before, after)
+        if math.ceil((length + added) / CHARS_PER_TOKEN) > budget:
+            continue
+        selected.insert(position, i)
+        length += added
+
+    lines = []
+    previous = None
+    for i in selected:
+        if previous is not None and i != previous + 1:
+            lines.append(GAP)
+        lines.append(segments[i])
+        previous = i
+    return "\n".join(lines)
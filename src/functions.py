@@ -1,15 +1,31 @@
 import re
+import json
 import logging
+import threading
 
 from datetime import datetime
+from itertools import batched
+from concurrent.futures import ThreadPoolExecutor
 
 from llm import generate
 from llm import embed
+from llm import warm_up_models
 from config import Config
 from model import DocumentTitel
 from model import TaxReportRelevant
 from model import DocumentType
 from model import Sender
+from model import DocumentClassification
+from context import select_context
+from ledger import content_hash
+from ledger import fingerprint
+from ledger import record as record_in_ledger
+from ledger import get as get_ledger_entry
+from ledger import stale_stages
+from ledger import record_decision
+from near_duplicate import derive_title
+from knn import predict as knn_predict
+from knn import query_size as knn_query_size
 from paperless import create_correspondent
 from paperless import get_tags
 from paperless import create_document_type
@@ -18,208 +34,285 @@ from paperless import get_document_types
 from paperless import update_document
 from paperless import get_documents
 from paperless import create_tag
-from chroma import correspondents_collection
-from chroma import document_types_collection
-from chroma import documents_collection
-from chroma import tags_collection
+from chroma import get_correspondents_collection
+from chroma import get_document_types_collection
+from chroma import get_documents_collection
+from chroma import get_tags_collection
+from chroma import COLLECTION_NAMES
+from chroma import get_collection
+from chroma import is_open
+from chroma import delete_ids
+from chroma import update_metadatas
+from batching import embed_and_upsert
+from reconcile import reconcile
+from reconcile import load_index
+from reconcile import apply
+from chunking import chunk_id
+from chunking import chunk_text
+from chunking import aggregate_distances
+from chunking import load_document_index
+from name_index import tags_index
+from name_index import correspondents_index
+from name_index import document_types_index
+from name_index import normalize
+from singleflight import SingleFlight
+from metrics import timed
+from metrics import timed_stage
+from metrics import entities_created
+from metrics import validation_failures
+from metrics import classification_decisions
+from metrics import llm_calls_skipped
+from sync import refresh_if_stale
+from sync import tags_snapshot
+from sync import correspondents_snapshot
+from sync import document_types_snapshot
+from sync import documents_snapshot
 
 logger = logging.getLogger(__name__)
 
-def delete_stale_tags(tags):
-    existing_ids = [str(t["id"]) for t in tags]
-    all_ids = tags_collection.get()['ids']
-    ids_to_delete = [id for id in all_ids if id not in existing_ids]
-    if ids_to_delete:
-        logger.info(f"Deleting {len(ids_to_delete)} tags that are not in Paperless anymore.")
-        tags_collection.delete(ids=ids_to_delete)
+_creations = SingleFlight()
+# Up to four stages of a document run at once, callers with their own concurrency like bulk runs bring their own pool
+STAGES_PER_DOCUMENT = 4
+_stage_pool = ThreadPoolExecutor(max_workers=STAGES_PER_DOCUMENT * Config.WORKER_COUNT, thread_name_prefix="stage")
+
+ENTITY_FIELDS = ["id", "name"]
+DOCUMENT_FIELDS = ["id", "title", "document_type", "correspondent", "created", "modified"]
+
+def _name(entity):
+    return entity["name"]
+
+def _name_metadata(entity):
+    return {"id": str(entity["id"]), "name": entity["name"]}
+
+def _chunk_text(chunk):
+    return chunk["text"]
+
+def _chunk_metadata(chunk):
+    return chunk["metadata"]
+
+def _document_metadata(document):
+    return {
+        "parent_id": str(document["id"]),
+        "title": document["title"],
+        "document_type_id": str(document["document_type"]),
+        "correspondent_id": str(document["correspondent"]),
+        "created": (document.get("created") or "")[:10]
+    }
+
+def _sync_entities(collection, snapshot, index, entities):
+    with snapshot.lock:
+        result = reconcile(load_index(collection), entities, _name_metadata)
+        apply(collection, result, text=_name, metadata=_name_metadata)
+        snapshot.update()
+        index.remove(result.deletes)
+        index.refresh([str(entity["id"]) for entity in result.inserts + result.updates])
+
+def _match_name(name: str, index, collection, label: str):
+    """ Match a generated name against a catalog, returning (match or None, embedding or None) """
+    try:
+        match = index.lookup(name)
+    except Exception:
+        logger.exception(f"Name index for {label}s is not available, falling back to ChromaDB.")
+        match = None
+    if match:
+        logger.info(f"Found matching {label} by name: {match['name']}")
+        return (match, None)
+
+    embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=name)
+    embeddings = embedding_response["embeddings"]
+    maximum_distance = Config.COLLECTIONS[collection.name]["maximum_distance"]
+    if index.ready:
+        nearest = index.nearest(embeddings[0], maximum_distance)
+    else:
+        matching = collection.query(
+            query_embeddings=embeddings,
+            n_results=2
+        )
+        logger.info(f"Matching {label}s: {matching}")
+        nearest = min([
+            (match, distance) for match, distance in zip(matching['metadatas'][0], matching['distances'][0])
+            if distance <= maximum_distance
+        ], key=lambda x: x[1], default=None)
+
+    if nearest is None:
+        return (None, embeddings[0])
+    logger.info(f"Found matching {label}: {nearest[0]['name']} with distance {nearest[1]}")
+    return (nearest[0], embeddings[0])
 
 def sync_tags():
     logger.info("Synchronizing tags...")
-    tags = get_tags()
-    delete_stale_tags(tags)
-    for tag in tags:
-        tag_existing = tags_collection.get(ids=[str(tag["id"])])
-        saved_tag_has_same_name = (tag_existing['metadatas'] and tag_existing['metadatas'][0]['name'] == tag['name'])
-        if tag_existing['ids'] and saved_tag_has_same_name:
-            logger.info(f"Tag with ID {tag['id']} and name '{tag['name']}' already exists in ChromaDB. Skipping upsert.")
-            continue
-        logger.info(f"Processing tag: {tag['name']}")
-        embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=tag["name"])
-        embeddings = embedding_response["embeddings"]
-        tags_collection.upsert(
-            documents=[tag["name"]],
-            ids=[str(tag["id"])],
-            metadatas=[{"id": str(tag["id"]), "name": tag["name"]}],
-            embeddings=embeddings
+    _sync_entities(get_tags_collection(), tags_snapshot, tags_index, get_tags(fields=ENTITY_FIELDS))
+
+def _write_through(collection, index, entity, embedding = None):
+    """ Index a freshly created entity directly instead of resynchronizing the whole catalog """
+    if embedding is None:
+        embedding = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=entity["name"])["embeddings"][0]
+    metadata = _name_metadata(entity)
+    with timed("chroma_upsert"):
+        collection.upsert(
+            documents=[entity["name"]],
+            ids=[metadata["id"]],
+            metadatas=[metadata],
+            embeddings=[embedding]
         )
+    index.upsert([metadata["id"]], [metadata], [embedding])
+
+def _create_once(name: str, create, collection, index, embedding = None):
+    """ Create an entity unless a concurrent or earlier call already created it under the same normalized name """
+    def create_and_index():
+        existing = index.lookup(name)
+        if existing:
+            logger.info(f"'{name}' was created concurrently as '{existing['name']}'.")
+            return existing
+        entity = create(name=name)
+        entities_created.labels(collection.name).inc()
+        _write_through(collection, index, entity, embedding)
+        return entity
+
+    return _creations.do((collection.name, normalize(name)), create_and_index)
 
 def create_tag_if_not_exists(name: str):
-    exiting_tags = tags_collection.get()
-    for existing_tag in exiting_tags['metadatas']:
-        if existing_tag['name'].lower() == name.lower():
-            logger.info(f"Tag '{name}' already exists with ID {existing_tag['id']}.")
-            return existing_tag
+    existing_tag = tags_index.lookup(name)
+    if existing_tag:
+        logger.info(f"Tag '{name}' already exists with ID {existing_tag['id']}.")
+        return existing_tag
 
     logger.info(f"Tag '{name}' does not exist. Creating a new tag.")
-    new_tag = create_tag(name)
-    embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=new_tag["name"])
-    embeddings = embedding_response["embeddings"]
-    tags_collection.upsert(
-        documents=[new_tag["name"]],
-        ids=[str(new_tag["id"])],
-        metadatas=[{"id": str(new_tag["id"]), "name": new_tag["name"]}],
-        embeddings=embeddings
-    )
-    return new_tag
+    return _create_once(name, create_tag, get_tags_collection(), tags_index)
 
 def get_correspondent_by_id(correspondent_id: int):
-    correspondent = correspondents_collection.get(ids=[str(correspondent_id)])
+    correspondent = get_correspondents_collection().get(ids=[str(correspondent_id)])
     if correspondent['ids']:
         return correspondent['metadatas'][0]
     return None
 
 def sync_correspondents():
     logger.info("Synchronizing correspondents...")
-    correspondents = get_correspondents()
-    delete_stale_correspondents(correspondents)
-    for correspondent in correspondents:
-        correspondent_existing = correspondents_collection.get(ids=[str(correspondent["id"])])
-        saved_correspondent_has_same_name = (correspondent_existing['metadatas'] and correspondent_existing['metadatas'][0]['name'] == correspondent['name'])
-        if correspondent_existing['ids'] and saved_correspondent_has_same_name:
-            logger.info(f"Correspondent with ID {correspondent['id']} and name '{correspondent['name']}' already exists in ChromaDB. Skipping upsert.")
-            continue
-        logger.info(f"Processing correspondent: {correspondent['name']}")
-        embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=correspondent["name"])
-        embeddings = embedding_response["embeddings"]
-        correspondents_collection.upsert(
-            documents=[correspondent["name"]],
-            ids=[str(correspondent["id"])],
-            metadatas=[{"id": str(correspondent["id"]), "name": correspondent["name"]}],
-            embeddings=embeddings
-        )
-
-def delete_stale_correspondents(correspondents):
-    existing_ids = [str(c["id"]) for c in correspondents]
-    all_ids = correspondents_collection.get()['ids']
-    ids_to_delete = [id for id in all_ids if id not in existing_ids]
-    if ids_to_delete:
-        logger.info(f"Deleting {len(ids_to_delete)} correspondents that are not in Paperless anymore.")
-        correspondents_collection.delete(ids=ids_to_delete)
+    _sync_entities(get_correspondents_collection(), correspondents_snapshot, correspondents_index, get_correspondents(fields=ENTITY_FIELDS))
 
 def get_document_type_by_id(document_type_id: int):
-    document_type = document_types_collection.get(ids=[str(document_type_id)])
+    document_type = get_document_types_collection().get(ids=[str(document_type_id)])
     if document_type['ids']:
         return document_type['metadatas'][0]
     return None
 
 def sync_document_types():
     logger.info("Synchronizing document types...")
-    document_types = get_document_types()
-    delete_stale_document_types(document_types)
-    for document_type in document_types:
-        document_type_existing = document_types_collection.get(ids=[str(document_type["id"])])
-        saved_document_type_has_same_name = (document_type_existing['metadatas'] and document_type_existing['metadatas'][0]['name'] == document_type['name'])
-        if document_type_existing['ids'] and saved_document_type_has_same_name:
-            logger.info(f"Document type with ID {document_type['id']} and name '{document_type['name']}' already exists in ChromaDB. Skipping upsert.")
-            continue
-        logger.info(f"Processing document type: {document_type['name']}")
-        embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=document_type["name"])
-        embeddings = embedding_response["embeddings"]
-        document_types_collection.upsert(
-            documents=[document_type["name"]],
-            ids=[str(document_type["id"])],
-            metadatas=[{"id": str(document_type["id"]), "name": document_type["name"]}],
-            embeddings=embeddings
-        )
+    _sync_entities(get_document_types_collection(), document_types_snapshot, document_types_index, get_document_types(fields=ENTITY_FIELDS))
 
-def delete_stale_document_types(document_types):
-    existing_ids = [str(dt["id"]) for dt in document_types]
-    all_ids = document_types_collection.get()['ids']
-    ids_to_delete = [id for id in all_ids if id not in existing_ids]
-    if ids_to_delete:
-        logger.info(f"Deleting {len(ids_to_delete)} document types that are not in Paperless anymore.")
-        document_types_collection.delete(ids=ids_to_delete)
-
-def sync_documents(pre_generated_embedding = None):
+def sync_documents(pre_generated_embeddings: dict = None):
     logger.info("Synchronizing documents...")
-    documents = get_documents()
-    delete_stale_documents(documents)
-    for document in documents:
-        document_existing = documents_collection.get(ids=[str(document["id"])])
-        if document_existing['ids']:
-            logger.info(f"Document with ID {document['id']} already exists in ChromaDB. Skipping upsert.")
-            continue
-
-        logger.info(f"Processing document: {document['id']} - {document['title']}")
-        if pre_generated_embedding:
-            embeddings = pre_generated_embedding
+    with documents_snapshot.lock:
+        collection = get_documents_collection()
+        full_sync = documents_snapshot.is_stale()
+        if full_sync:
+            documents = get_documents(fields=DOCUMENT_FIELDS)
+            parents, chunk_ids, legacy_ids = load_document_index(collection)
         else:
-            embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=document["content"])
-            embeddings = embedding_response["embeddings"]
-        documents_collection.upsert(
-            documents=[document["content"]],
-            ids=[str(document["id"])],
-            metadatas=[{
-                "id": str(document["id"]), 
-                "title": document["title"],
-                "document_type_id": str(document["document_type"]),
-                "correspondent_id": str(document["correspondent"])
-                }],
-            embeddings=embeddings
+            logger.info(f"Fetching documents modified after {documents_snapshot.watermark}.")
+            # Only the changed documents are looked up, an incremental sync must not cost a scan of the archive
+            documents = list(get_documents(modified_after=documents_snapshot.watermark, fields=DOCUMENT_FIELDS))
+            parents, chunk_ids, legacy_ids = load_document_index(
+                collection, parent_ids=[str(document["id"]) for document in documents]
+            )
+
+        watermark = None
+        def track_watermark(documents):
+            nonlocal watermark
+            for document in documents:
+                if document.get("modified") and (watermark is None or document["modified"] > watermark):
+                    watermark = document["modified"]
+                yield document
+
+        result = reconcile(parents, track_watermark(documents), _document_metadata, partial=not full_sync)
+        logger.info(f"Applying {result} to '{collection.name}'.")
+
+        ids_to_delete = legacy_ids + [id for parent_id in result.deletes for id in chunk_ids[parent_id]]
+        if ids_to_delete:
+            delete_ids(collection, ids_to_delete)
+
+        if result.updates:
+            # Only the metadata changed, the stored chunk embeddings stay valid
+            update_ids = []
+            chunk_metadatas = []
+            for document in result.updates:
+                for id in chunk_ids[str(document["id"])]:
+                    update_ids.append(id)
+                    chunk_metadatas.append({**result.current[str(document["id"])], "chunk": int(id.rsplit("#", 1)[1])})
+            update_metadatas(collection, update_ids, chunk_metadatas)
+
+        embed_and_upsert(
+            collection,
+            _chunks(_with_content(result.inserts)),
+            text=_chunk_text,
+            metadata=_chunk_metadata,
+            batch_size=Config.DOCUMENT_EMBED_BATCH_SIZE,
+            known_embeddings=pre_generated_embeddings
         )
+        documents_snapshot.update(watermark=watermark)
 
-def delete_stale_documents(documents):
-    existing_ids = [str(doc["id"]) for doc in documents]
-    all_ids = documents_collection.get()['ids']
-    ids_to_delete = [id for id in all_ids if id not in existing_ids]
+def _with_content(documents):
+    """ Fetch the content of the given documents page by page """
+    for batch in batched(documents, Config.PAPERLESS_PAGE_SIZE):
+        yield from get_documents(ids=[document["id"] for document in batch], fields=DOCUMENT_FIELDS + ["content"])
+
+def _chunks(documents):
+    for document in documents:
+        metadata = _document_metadata(document)
+        for index, text in enumerate(chunk_text(document["content"])):
+            yield {"id": chunk_id(document["id"], index), "text": text, "metadata": {**metadata, "chunk": index}}
+
+def delete_stale_documents(existing_ids: set):
+    collection = get_documents_collection()
+    parents, chunk_ids, legacy_ids = load_document_index(collection)
+    stale_parents = parents.keys() - existing_ids
+    ids_to_delete = legacy_ids + [id for parent_id in stale_parents for id in chunk_ids[parent_id]]
     if ids_to_delete:
-        logger.info(f"Deleting {len(ids_to_delete)} documents that are not in Paperless anymore.")
-        documents_collection.delete(ids=ids_to_delete)
+        logger.info(f"Deleting {len(stale_parents)} documents that are not in Paperless anymore.")
+        delete_ids(collection, ids_to_delete)
+
+@timed_stage("similarity_search")
+def search_similar_documents(content: str, exclude_id = None):
+    """ Find the most similar stored document by its chunks, returning it with the chunk embeddings of content
+    and the raw query result for the kNN vote
 
-def search_similar_documents(content: str):
-    embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=content)
+    exclude_id leaves out the document itself when it is already indexed.
+    """
+    embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=chunk_text(content))
     embeddings = embedding_response["embeddings"]
-    matching_documents = documents_collection.query(
+    collection = get_documents_collection()
+    if collection.count() == 0:
+        logger.info("No similar documents found.")
+        return (None, embeddings, None)
+
+    matching_chunks = collection.query(
         query_embeddings=embeddings,
-        n_results=1
+        n_results=knn_query_size() if Config.KNN_ENABLED else Config.SIMILAR_CHUNK_RESULTS
     )
-    matching_documents_with_distances = sorted([
+    matching_documents_with_distances = [
         (match, distance)
-        for match, distance in zip(matching_documents['metadatas'][0], matching_documents['distances'][0])
-        if distance <= Config.MAXIMUM_MATCHING_DISTANCE
-    ], key=lambda x: x[1])
+        for match, distance in aggregate_distances(matching_chunks)
+        if distance <= Config.COLLECTIONS["documents"]["maximum_distance"] and match.get("parent_id") != str(exclude_id)
+    ]
 
     if len(matching_documents_with_distances) == 0:
         logger.info("No similar documents found.")
-        return (None, embeddings)
+        return (None, embeddings, matching_chunks)
 
-    return (matching_documents_with_distances[0], embeddings)
-
-def get_head_and_tail(text: str, head_length: int = 1000, tail_length: int = 500) -> str:
-    if len(text) <= head_length + tail_length:
-        return text
-    head = text[:head_length]
-    tail = text[-tail_length:]
-
-    template = """<HEAD>
-{head}
-</HEAD>
-<TAIL>
-{tail}
-</TAIL>"""
-
-    return template.format(head=head, tail=tail)
+    return (matching_documents_with_distances[0], embeddings, matching_chunks)
 
+@timed_stage("generate_title")
 def generate_title(content: str, similar_document_title: str) -> str:
 
     document_title_system_prompt_formatted = Config.DOCUMENT_TITLE_SYSTEM_PROMPT.format(
-        DOCUMENT_TEXT=content, SIMILAR_DOCUMENT_TITLE=similar_document_title
+        DOCUMENT_TEXT=select_context(content), SIMILAR_DOCUMENT_TITLE=similar_document_title
     )
 
     document_title_response = generate(
         prompt=document_title_system_prompt_formatted,
         model=Config.OLLAMA_LLM_MODEL,
-        format=DocumentTitel.model_json_schema()
+        format=DocumentTitel.model_json_schema(),
+        validate=DocumentTitel.model_validate_json
     )
 
     try:
@@ -229,18 +322,24 @@ def generate_title(content: str, similar_document_title: str) -> str:
         logger.info(f"Generated title: {document_title_information.titel}")
         return document_title_information.titel
     except Exception as e:
+        validation_failures.labels("title").inc()
         raise Exception("Fehler bei der Validierung des Dokumenttitels") from e
 
-def generate_correspondent(content: str, similar_correspondent_name: str) -> str:
+def generate_correspondent(content: str, similar_correspondent_name: str) -> dict:
+    return match_correspondent(generate_correspondent_name(content, similar_correspondent_name))
+
+@timed_stage("generate_correspondent")
+def generate_correspondent_name(content: str, similar_correspondent_name: str) -> str:
     correspondent_system_prompt_formatted = Config.CORRESPONDENT_SYSTEM_PROMPT.format(
-        DOCUMENT_TEXT=content,
+        DOCUMENT_TEXT=select_context(content),
         SIMILAR_CORRESPONDENT_NAME=similar_correspondent_name
     )
 
     correspondent_response = generate(
         prompt=correspondent_system_prompt_formatted,
         model=Config.OLLAMA_LLM_MODEL,
-        format=Sender.model_json_schema()
+        format=Sender.model_json_schema(),
+        validate=Sender.model_validate_json
     )
 
     try:
@@ -248,40 +347,37 @@ def generate_correspondent(content: str, similar_correspondent_name: str) -> str
             correspondent_response.response
         )
         logger.info(f"Identified sender: {sender_information.name}")
+        return sender_information.name
     except Exception as e:
+        validation_failures.labels("correspondent").inc()
         raise Exception("Fehler bei der Validierung des Senders") from e
 
-    embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=sender_information.name)
-    embeddings = embedding_response["embeddings"]
-    matching_correspondents = correspondents_collection.query(
-        query_embeddings=embeddings,
-        n_results=2
+@timed_stage("match_correspondent")
+def match_correspondent(name: str) -> dict:
+    (match, embedding) = _match_name(name, correspondents_index, get_correspondents_collection(), "correspondent")
+    if match:
+        return match
+
+    logger.info(f"No matching correspondent found for '{name}', creating new correspondent.")
+    return _create_once(
+        name, create_correspondent, get_correspondents_collection(), correspondents_index, embedding
     )
-    logger.info(f"Matching correspondents: {matching_correspondents}")
-    matching_correspondents = sorted([
-        (match, distance) for match, distance in zip(matching_correspondents['metadatas'][0], matching_correspondents['distances'][0])
-        if distance <= Config.MAXIMUM_MATCHING_DISTANCE
-    ], key=lambda x: x[1])
-
-    if len(matching_correspondents) == 0:
-        logger.info(f"No matching correspondent found for '{sender_information.name}', creating new correspondent.")
-        correspondent = create_correspondent(name=sender_information.name)
-        sync_correspondents()
-        return correspondent
-
-    logger.info(f"Found matching correspondent: {matching_correspondents[0][0]['name']} with distance {matching_correspondents[0][1]}")
-    return matching_correspondents.pop(0)[0]
-
-def generate_document_type(content: str, similar_document_type_name: str) -> str:
+
+def generate_document_type(content: str, similar_document_type_name: str) -> dict:
+    return match_document_type(generate_document_type_name(content, similar_document_type_name))
+
+@timed_stage("generate_document_type")
+def generate_document_type_name(content: str, similar_document_type_name: str) -> str:
     document_type_system_prompt_formatted = Config.DOCUMENT_TYPE_SYSTEM_PROMPT.format(
-        DOCUMENT_TEXT=content,
+        DOCUMENT_TEXT=select_context(content),
         SIMILAR_DOCUMENT_TYPE_NAME=similar_document_type_name
     )
 
     document_type_response = generate(
         prompt=document_type_system_prompt_formatted,
         model=Config.OLLAMA_LLM_MODEL,
-        format=DocumentType.model_json_schema()
+        format=DocumentType.model_json_schema(),
+        validate=DocumentType.model_validate_json
     )
 
     try:
@@ -289,43 +385,34 @@ def generate_document_type(content: str, similar_document_type_name: str) -> str
             document_type_response.response
         )
         logger.info(f"Identified document type: {document_type_information.name}")
+        return document_type_information.name
     except Exception as e:
+        validation_failures.labels("document_type").inc()
         raise Exception("Fehler bei der Validierung des Dokumenttyps") from e
 
-    embedding_response = embed(model=Config.OLLAMA_EMBEDDING_MODEL, input=document_type_information.name)
-    embeddings = embedding_response["embeddings"]
-    matching_document_types = document_types_collection.query(
-        query_embeddings=embeddings,
-        n_results=2
-    )
-
-    logger.info(f"Matching document types: {matching_document_types}")
+@timed_stage("match_document_type")
+def match_document_type(name: str) -> dict:
+    (match, embedding) = _match_name(name, document_types_index, get_document_types_collection(), "document type")
+    if match:
+        return match
 
-    matching_document_types_with_distances = sorted([
-        (match, distance)
-        for match, distance in zip(matching_document_types['metadatas'][0], matching_document_types['distances'][0])
-        if distance <= Config.MAXIMUM_MATCHING_DISTANCE
-    ], key=lambda x: x[1])
-
-    if len(matching_document_types_with_distances) == 0:
-        logger.info(f"No matching document type found for '{document_type_information.name}', creating new document type.")
-        document_type = create_document_type(name=document_type_information.name)
-        sync_document_types()
-        return document_type
-
-    logger.info(f"Found matching document type: {matching_document_types_with_distances[0][0]['name']} with distance {matching_document_types_with_distances[0][1]}")
-    return matching_document_types_with_distances.pop(0)[0]
+    logger.info(f"No matching document type found for '{name}', creating new document type.")
+    return _create_once(
+        name, create_document_type, get_document_types_collection(), document_types_index, embedding
+    )
 
+@timed_stage("generate_tax_report_relevance")
 def generate_tax_report_relevance(content: str) -> bool:
     next_year = datetime.now().year + 1
     tax_report_relevance_system_prompt_formatted = Config.TAX_REPORT_RELEVANT_SYSTEM_PROMPT.format(
-        DOCUMENT_TEXT=content, TAX_YEAR=next_year
+        DOCUMENT_TEXT=select_context(content), TAX_YEAR=next_year
     )
 
     tax_report_relevance_response = generate(
         prompt=tax_report_relevance_system_prompt_formatted,
         model=Config.OLLAMA_LLM_MODEL,
-        format=TaxReportRelevant.model_json_schema()
+        format=TaxReportRelevant.model_json_schema(),
+        validate=TaxReportRelevant.model_validate_json
     )
 
     try:
@@ -335,8 +422,63 @@ def generate_tax_report_relevance(content: str) -> bool:
         logger.info(f"Generated tax report relevance: {tax_report_relevance_information.relevant}")
         return tax_report_relevance_information.relevant
     except Exception as e:
+        validation_failures.labels("tax_report_relevance").inc()
         raise Exception("Fehler bei der Validierung der Steuerberichtsrelevanz") from e
 
+@timed_stage("generate_classification")
+def generate_classification(
+        content: str,
+        similar_document_title: str,
+        similar_correspondent_name: str,
+        similar_document_type_name: str
+    ) -> dict:
+    """ Extract all fields with one generate call, returning only the fields that passed validation """
+    classification_prompt_formatted = Config.CLASSIFICATION_SYSTEM_PROMPT.format(
+        DOCUMENT_TEXT=select_context(content),
+        SIMILAR_DOCUMENT_TITLE=similar_document_title,
+        SIMILAR_CORRESPONDENT_NAME=similar_correspondent_name,
+        SIMILAR_DOCUMENT_TYPE_NAME=similar_document_type_name,
+        TAX_YEAR=datetime.now().year + 1
+    )
+
+    classification_response = generate(
+        prompt=classification_prompt_formatted,
+        model=Config.OLLAMA_LLM_MODEL,
+        format=DocumentClassification.model_json_schema(),
+        validate=DocumentClassification.model_validate_json
+    )
+
+    try:
+        raw_fields = json.loads(classification_response.response)
+    except Exception:
+        validation_failures.labels("classification").inc()
+        logger.warning("Combined classification response is not valid JSON, falling back to single-field calls.")
+        return {}
+
+    # Validate every field on its own so a single bad field does not discard the others
+    validators = {
+        "titel": lambda value: DocumentTitel(titel=value).titel,
+        "sender": lambda value: Sender(name=value).name,
+        "document_type": lambda value: DocumentType(name=value).name,
+        "tax_relevant": lambda value: TaxReportRelevant(relevant=value).relevant
+    }
+    fields = {}
+    for field, validate in validators.items():
+        try:
+            value = validate(raw_fields.get(field))
+        except Exception:
+            validation_failures.labels(f"classification_{field}").inc()
+            logger.warning(f"Combined classification field '{field}' failed validation: {raw_fields.get(field)!r}")
+            continue
+        if isinstance(value, str) and not value.strip():
+            validation_failures.labels(f"classification_{field}").inc()
+            logger.warning(f"Combined classification field '{field}' is empty.")
+            continue
+        fields[field] = value
+
+    logger.info(f"Generated classification: {fields}")
+    return fields
+
 def get_id_from_url(url: str) -> int:
     logger.info(f"Extracting ID from URL: {url}")
     m = re.search(r'/documents/(\d+)/?$', url.strip())
@@ -345,19 +487,122 @@ def get_id_from_url(url: str) -> int:
     
     raise ValueError("Invalid URL format")
 
-def identify_and_update_document(document):
+def _refresh_documents():
+    delete_stale_documents({str(d["id"]) for d in get_documents(fields=["id"], page_size=Config.PAPERLESS_ID_PAGE_SIZE)})
+    documents_snapshot.update()
+
+def ensure_metadata_synced(force: bool = False):
+    """ Refresh the snapshots that are stale, force refreshes the entity catalogs but leaves documents to their TTL """
+    if force:
+        for snapshot in (correspondents_snapshot, document_types_snapshot, tags_snapshot):
+            snapshot.mark_dirty()
+    refresh_if_stale(correspondents_snapshot, sync_correspondents)
+    refresh_if_stale(document_types_snapshot, sync_document_types)
+    refresh_if_stale(tags_snapshot, sync_tags)
+    refresh_if_stale(documents_snapshot, _refresh_documents)
+
+def _reuse_near_duplicate(document, neighbour: dict, pending: set, fingerprints: dict) -> dict:
+    """ Fields of a near-duplicate document that carry over to this one as they are """
+    fields = {}
+    # A correspondent or document type deleted since the neighbour was indexed would fail the update
+    if (
+        "correspondent" in pending
+        and neighbour["correspondent_id"] != "None"
+        and get_correspondent_by_id(neighbour["correspondent_id"]) is not None
+    ):
+        fields["correspondent"] = int(neighbour["correspondent_id"])
+    if (
+        "document_type" in pending
+        and neighbour["document_type_id"] != "None"
+        and get_document_type_by_id(neighbour["document_type_id"]) is not None
+    ):
+        fields["document_type"] = int(neighbour["document_type_id"])
+    if "title" in pending:
+        title = derive_title(neighbour["title"], neighbour.get("created"), document.get("created"))
+        if title:
+            fields["title"] = title
+    if "tax_report_relevance" in pending:
+        # Only a relevance asked with the current prompt for the current tax year carries over
+        entry = get_ledger_entry(int(neighbour["parent_id"]))
+        if (
+            entry
+            and entry["stages"].get("tax_report_relevance") == fingerprints["tax_report_relevance"]
+            and "tax_report_relevance" in entry["result"]
+        ):
+            fields["tax_report_relevance"] = entry["result"]["tax_report_relevance"]
+    return fields
+
+@timed_stage("knn_vote")
+def _knn_fields(matching_chunks: dict, document_id, fields: set) -> dict:
+    """ Confident kNN votes for the given fields whose entity still exists """
+    lookups = {"correspondent": get_correspondent_by_id, "document_type": get_document_type_by_id}
+    return {
+        field: id
+        for field, id in knn_predict(matching_chunks, exclude_id=document_id).items()
+        if field in fields and lookups[field](id) is not None
+    }
+
+def stage_fingerprints() -> dict:
+    """ Model and prompt fingerprint of every enabled stage, a stage reruns when its fingerprint changes """
+    shared = [Config.OLLAMA_LLM_MODEL, Config.CONTEXT_TOKEN_BUDGET]
+    if Config.COMBINED_EXTRACTION_ENABLED:
+        shared += [Config.CLASSIFICATION_SYSTEM_PROMPT, DocumentClassification.model_json_schema()]
+
+    fingerprints = {}
+    if Config.TITLE_FEATURE_ENABLED:
+        fingerprints["title"] = fingerprint(*shared, Config.DOCUMENT_TITLE_SYSTEM_PROMPT, DocumentTitel.model_json_schema())
+    # Correspondents and document types are matched by embedding as well
+    if Config.CORRESPONDENT_FEATURE_ENABLED:
+        fingerprints["correspondent"] = fingerprint(
+            *shared, Config.CORRESPONDENT_SYSTEM_PROMPT, Sender.model_json_schema(), Config.OLLAMA_EMBEDDING_MODEL
+        )
+    if Config.DOCUMENT_TYPE_FEATURE_ENABLED:
+        fingerprints["document_type"] = fingerprint(
+            *shared, Config.DOCUMENT_TYPE_SYSTEM_PROMPT, DocumentType.model_json_schema(), Config.OLLAMA_EMBEDDING_MODEL
+        )
+    # The tax relevance is asked for the coming tax year
+    if Config.TAX_REPORT_RELEVANCE_FEATURE_ENABLED:
+        fingerprints["tax_report_relevance"] = fingerprint(
+            *shared, Config.TAX_REPORT_RELEVANT_SYSTEM_PROMPT, TaxReportRelevant.model_json_schema(), datetime.now().year + 1
+        )
+    return fingerprints
 
-    sync_correspondents()
-    sync_document_types()
-    sync_tags()
-    delete_stale_documents(get_documents())
+def identify_and_update_document(document, progress = None, sync: bool = True, force: bool = False, stage_pool = None):
+    """ Run the stages that are new or stale for this document, returns None if nothing had to run """
+    progress = progress or (lambda stage: None)
+    stage_pool = stage_pool or _stage_pool
 
     content = document["content"]
+    document_content_hash = content_hash(content)
+    fingerprints = stage_fingerprints()
+    if force:
+        pending = set(fingerprints)
+    else:
+        entry = get_ledger_entry(document["id"])
+        pending = stale_stages(entry, document_content_hash, fingerprints)
+        # New or changed content always runs, it still has to be tagged and indexed with no stage enabled
+        if not pending and entry is not None and entry["content_hash"] == document_content_hash:
+            logger.info(f"Document {document['id']} is unchanged since it was last processed, skipping.")
+            return None
+        if pending != set(fingerprints):
+            logger.info(f"Document {document['id']} is unchanged, rerunning the stale stages {sorted(pending)}.")
+
+    # Bulk runs pass sync=False and synchronize once per batch instead
+    if sync:
+        progress("sync")
+        with timed("metadata_sync"):
+            ensure_metadata_synced()
 
     similar_title = ''
     similar_correspondent = ''
     similar_document_type = ''
-    (similar_document, embeddings) = search_similar_documents(content)
+    similar_document = None
+    embeddings = []
+    matching_chunks = None
+    # The tax relevance does not depend on similar documents
+    if pending - {"tax_report_relevance"}:
+        progress("similarity")
+        (similar_document, embeddings, matching_chunks) = search_similar_documents(content, exclude_id=document["id"])
     if similar_document:
         logger.info(f"Found similar document with title: {similar_document[0]['title']} and distance {similar_document[1]}")
         similar_correspondent = get_correspondent_by_id(similar_document[0]['correspondent_id'])
@@ -366,20 +611,64 @@ def identify_and_update_document(document):
         similar_correspondent = similar_correspondent['name'] if similar_correspondent else ''
         similar_document_type = similar_document_type['name'] if similar_document_type else ''
 
-
-    head_and_tail = get_head_and_tail(content)
+    # Recurring documents take over the fields of a near-duplicate without asking the LLM
+    predicted = {}
+    path = "llm"
+    if similar_document and Config.NEAR_DUPLICATE_ENABLED and similar_document[1] <= Config.NEAR_DUPLICATE_MAXIMUM_DISTANCE:
+        predicted = _reuse_near_duplicate(document, similar_document[0], pending, fingerprints)
+        if predicted:
+            path = "near_duplicate"
+            logger.info(f"Reusing {sorted(predicted)} of near-duplicate document {similar_document[0]['parent_id']}.")
+    # Otherwise the neighbours in the archive vote on sender and type
+    if matching_chunks and Config.KNN_ENABLED:
+        voted = _knn_fields(matching_chunks, document["id"], pending - predicted.keys())
+        if voted:
+            path = "knn" if path == "llm" else path
+            predicted.update(voted)
+            logger.info(f"Neighbours agree on {voted}.")
+    remaining = pending - predicted.keys()
+
+    # Selected once here, the generate_* calls keep it as it already fits the budget
+    context = select_context(content)
     title = None
     correspondent = None
     document_type = None
     tax_report_relevance = False
-    if Config.TITLE_FEATURE_ENABLED:
-        title = generate_title(head_and_tail, similar_document_title=similar_title)
-    if Config.CORRESPONDENT_FEATURE_ENABLED:
-        correspondent = generate_correspondent(head_and_tail, similar_correspondent_name=similar_correspondent)['id']
-    if Config.DOCUMENT_TYPE_FEATURE_ENABLED:
-        document_type = generate_document_type(head_and_tail, similar_document_type_name=similar_document_type)['id']
-    if Config.TAX_REPORT_RELEVANCE_FEATURE_ENABLED:
-        tax_report_relevance = generate_tax_report_relevance(content)
+    progress("generate")
+    combined = {}
+    if Config.COMBINED_EXTRACTION_ENABLED and remaining:
+        combined = generate_classification(context, similar_title, similar_correspondent, similar_document_type)
+
+    # The stages are independent, the Ollama concurrency limit is enforced in llm
+    stages = {}
+    if "title" in remaining and "titel" not in combined:
+        stages["title"] = stage_pool.submit(generate_title, context, similar_document_title=similar_title)
+    if "correspondent" in remaining:
+        if "sender" in combined:
+            stages["correspondent"] = stage_pool.submit(match_correspondent, combined["sender"])
+        else:
+            stages["correspondent"] = stage_pool.submit(generate_correspondent, context, similar_correspondent_name=similar_correspondent)
+    if "document_type" in remaining:
+        if "document_type" in combined:
+            stages["document_type"] = stage_pool.submit(match_document_type, combined["document_type"])
+        else:
+            stages["document_type"] = stage_pool.submit(generate_document_type, context, similar_document_type_name=similar_document_type)
+    if "tax_report_relevance" in remaining and "tax_relevant" not in combined:
+        stages["tax_report_relevance"] = stage_pool.submit(generate_tax_report_relevance, context)
+
+    result = dict(predicted)
+    if "title" in remaining:
+        result["title"] = stages["title"].result() if "title" in stages else combined["titel"]
+    if "correspondent" in stages:
+        result["correspondent"] = stages["correspondent"].result()['id']
+    if "document_type" in stages:
+        result["document_type"] = stages["document_type"].result()['id']
+    if "tax_report_relevance" in remaining:
+        result["tax_report_relevance"] = stages["tax_report_relevance"].result() if "tax_report_relevance" in stages else combined["tax_relevant"]
+    title = result.get("title")
+    correspondent = result.get("correspondent")
+    document_type = result.get("document_type")
+    tax_report_relevance = result.get("tax_report_relevance", False)
 
     document_tags = document.get("tags", [])
     if tax_report_relevance:
@@ -398,14 +687,60 @@ def identify_and_update_document(document):
         logger.info(f"Adding identification tag with ID {Config.TAG_ID_TO_ADD_AFTER_IDENTIFICATION} to document.")
         document_tags.append(Config.TAG_ID_TO_ADD_AFTER_IDENTIFICATION)
 
-    updated_document = update_document(
-        document_id=document["id"],
-        title=title,
-        correspondent_id=correspondent,
-        document_type_id=document_type,
-        document_tags=document_tags
+    progress("update")
+    with timed("paperless_update"):
+        updated_document = update_document(
+            document_id=document["id"],
+            title=title,
+            correspondent_id=correspondent,
+            document_type_id=document_type,
+            document_tags=document_tags
+        )
+    record_in_ledger(
+        document["id"],
+        document_content_hash,
+        {stage: fingerprints[stage] for stage in pending},
+        result,
+        modified=updated_document.get("modified")
     )
-
-    sync_documents(pre_generated_embedding=embeddings)
+    record_decision(
+        document["id"],
+        path,
+        list(predicted),
+        distance=similar_document[1] if similar_document else None,
+        neighbour_id=similar_document[0]["parent_id"] if similar_document else None
+    )
+    classification_decisions.labels(path).inc()
+    for stage in predicted:
+        llm_calls_skipped.labels(stage).inc()
+
+    if sync:
+        progress("index")
+        with timed("document_index"):
+            sync_documents(pre_generated_embeddings={
+                chunk_id(document["id"], index): embedding for index, embedding in enumerate(embeddings)
+            })
     
-    return updated_document
\ No newline at end of file
+    return updated_document
+
+def warm_up():
+    """ Open the vector store and load the name indexes before the first job needs them """
+    try:
+        for name in COLLECTION_NAMES:
+            get_collection(name)
+        for index in (correspondents_index, document_types_index, tags_index):
+            index.ensure_loaded()
+        logger.info("Vector store is warm.")
+    except Exception:
+        logger.exception("Warming up the vector store failed, it is opened on first use instead.")
+    # Not part of readiness, a document that arrives meanwhile just waits for the load in Ollama
+    try:
+        warm_up_models()
+    except Exception:
+        logger.exception("Loading the Ollama models failed, they are loaded on first use instead.")
+
+def start_warm_up():
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+def is_ready() -> bool:
+    return is_open() and all(index.ready for index in (correspondents_index, document_types_index, tags_index))
@@ -0,0 +1,45 @@
+""" Production serving mode: gunicorn -c gunicorn.conf.py main:app """
+import os
+
+from config import Config
+
+bind = Config.WEB_BIND
+# Each worker process opens the ChromaDB store and keeps its own name indexes and sync snapshots.
+# Scale with WEB_THREADS and WORKER_COUNT first, more processes need PROMETHEUS_MULTIPROC_DIR set.
+workers = Config.WEB_WORKERS
+worker_class = "gthread"
+threads = Config.WEB_THREADS
+# Sync routes and the first request of a worker can run full Paperless syncs and LLM calls
+timeout = Config.WEB_TIMEOUT_SECONDS
+# Time a worker gets on shutdown to finish the job it is processing
+graceful_timeout = Config.WEB_GRACEFUL_TIMEOUT_SECONDS
+keepalive = 5
+
+# Every worker imports the app itself so the ChromaDB, Ollama and Paperless clients are
+# created after the fork, once per worker. Forked SQLite and HTTP connections are not safe.
+preload_app = False
+
+accesslog = "-"
+loglevel = Config.LOG_LEVEL.lower()
+
+def on_starting(server):
+    from jobs import init_queue
+    init_queue()
+
+def post_worker_init(worker):
+    from logger import setup_logging
+    from jobs import start_workers
+    from main import process_identify_job
+    from functions import start_warm_up
+    setup_logging()
+    start_warm_up()
+    start_workers(process_identify_job, requeue_interrupted=False)
+
+def worker_exit(server, worker):
+    from jobs import stop_workers
+    stop_workers(timeout=graceful_timeout)
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,232 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+from contextlib import closing
+from contextlib import contextmanager
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_wakeup = threading.Condition()
+_stopping = threading.Event()
+_workers = []
+# Running jobs of this process, their leases are renewed until they finish
+_held = set()
+_heartbeat = None
+
+def _connect():
+    connection = sqlite3.connect(Config.JOBS_DATABASE, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    return closing(connection)
+
+def init_queue(requeue_interrupted: bool = True):
+    os.makedirs(os.path.dirname(Config.JOBS_DATABASE) or ".", exist_ok=True)
+    with _lock, _connect() as connection:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                document_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                not_before REAL NOT NULL DEFAULT 0,
+                lease_until REAL
+            )
+        """)
+        columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+        if "not_before" not in columns:
+            connection.execute("ALTER TABLE jobs ADD COLUMN not_before REAL NOT NULL DEFAULT 0")
+        if "lease_until" not in columns:
+            connection.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_document_status ON jobs (document_id, status)")
+        if not requeue_interrupted:
+            return
+        # Jobs that were running when the process died are picked up again. With several
+        # worker processes only the server may do this, a worker would steal running jobs. Jobs
+        # of a single worker that dies are requeued by _claim_next once their lease expired.
+        requeued = connection.execute("UPDATE jobs SET status = 'queued', stage = NULL WHERE status = 'running'").rowcount
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted jobs.")
+
+def enqueue(document_id: int, debounce: float = None) -> str:
+    """ Queue a document, deliveries for a document that is still queued share its job """
+    debounce = Config.WEBHOOK_DEBOUNCE_SECONDS if debounce is None else debounce
+    now = time.time()
+    with _lock, _connect() as connection:
+        # Every further delivery within the window pushes the start back, so a burst runs once at its end
+        queued = connection.execute(
+            "UPDATE jobs SET not_before = ? WHERE document_id = ? AND status = 'queued' RETURNING id",
+            (now + debounce, document_id)
+        ).fetchone()
+        if queued:
+            logger.info(f"Coalesced delivery for document {document_id} into queued job {queued['id']}.")
+            return queued["id"]
+
+        job_id = uuid.uuid4().hex
+        connection.execute(
+            "INSERT INTO jobs (id, document_id, status, created_at, not_before) VALUES (?, ?, 'queued', ?, ?)",
+            (job_id, document_id, now, now + debounce)
+        )
+    logger.info(f"Enqueued job {job_id} for document {document_id}.")
+    with _wakeup:
+        _wakeup.notify()
+    return job_id
+
+def get_job(job_id: str) -> dict:
+    with _connect() as connection:
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def queue_stats() -> dict:
+    with _connect() as connection:
+        rows = connection.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+    return {row["status"]: row["count"] for row in rows}
+
+def set_stage(job_id: str, stage: str):
+    with _lock, _connect() as connection:
+        connection.execute("UPDATE jobs SET stage = ? WHERE id = ?", (stage, job_id))
+
+def _renew_leases():
+    while True:
+        time.sleep(Config.JOB_LEASE_SECONDS / 3)
+        with _lock:
+            held = list(_held)
+            if not held:
+                continue
+            try:
+                with _connect() as connection:
+                    connection.execute(
+                        f"UPDATE jobs SET lease_until = ? WHERE status = 'running' AND id IN ({','.join('?' * len(held))})",
+                        (time.time() + Config.JOB_LEASE_SECONDS, *held)
+                    )
+            except Exception:
+                logger.exception("Renewing the job leases failed.")
+
+def _hold(job_id: str):
+    """ Keep the lease of a claimed job alive, called with _lock held """
+    global _heartbeat
+    _held.add(job_id)
+    if _heartbeat is None:
+        _heartbeat = threading.Thread(target=_renew_leases, name="job-leases", daemon=True)
+        _heartbeat.start()
+
+def _requeue_expired(connection, now: float):
+    """ Queue the jobs of processes that died while running them, their leases ran out """
+    requeued = connection.execute(
+        "UPDATE jobs SET status = 'queued', stage = NULL WHERE status = 'running' AND COALESCE(lease_until, 0) < ?",
+        (now,)
+    ).rowcount
+    if requeued:
+        logger.warning(f"Requeued {requeued} jobs whose lease expired.")
+
+def _claim_next() -> dict:
+    now = time.time()
+    with _lock, _connect() as connection:
+        _requeue_expired(connection, now)
+        # A document is never processed by two workers at once, a new delivery waits for the running job
+        row = connection.execute("""
+            UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1, lease_until = ?
+            WHERE id = (
+                SELECT id FROM jobs AS queued
+                WHERE status = 'queued' AND not_before <= ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM jobs AS running WHERE running.document_id = queued.document_id AND running.status = 'running'
+                )
+                ORDER BY created_at LIMIT 1
+            )
+            RETURNING *
+        """, (now, now + Config.JOB_LEASE_SECONDS, now)).fetchone()
+        if row:
+            _hold(row["id"])
+    return dict(row) if row else None
+
+def _claim_document(job_id: str, document_id: int) -> bool:
+    now = time.time()
+    with _lock, _connect() as connection:
+        _requeue_expired(connection, now)
+        claimed = connection.execute("""
+            INSERT INTO jobs (id, document_id, status, attempts, created_at, started_at, not_before, lease_until)
+            SELECT ?, ?, 'running', 1, ?, ?, 0, ?
+            WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE document_id = ? AND status = 'running')
+        """, (job_id, document_id, now, now, now + Config.JOB_LEASE_SECONDS, document_id)).rowcount == 1
+        if claimed:
+            _hold(job_id)
+    return claimed
+
+@contextmanager
+def exclusive_job(document_id: int):
+    """ Process a document outside the queue as a running job, so queued jobs for it wait like for any other """
+    job_id = uuid.uuid4().hex
+    while not _claim_document(job_id, document_id):
+        time.sleep(Config.JOB_POLL_INTERVAL_SECONDS)
+    try:
+        yield job_id
+    except Exception as e:
+        _finish(job_id, "failed", error=str(e))
+        raise
+    _finish(job_id, "done")
+
+def _seconds_until_next_due() -> float:
+    with _connect() as connection:
+        row = connection.execute("SELECT MIN(not_before) AS due FROM jobs WHERE status = 'queued'").fetchone()
+    if row["due"] is None:
+        return Config.JOB_POLL_INTERVAL_SECONDS
+    return min(max(row["due"] - time.time(), 0.05), Config.JOB_POLL_INTERVAL_SECONDS)
+
+def _finish(job_id: str, status: str, error: str = None):
+    with _lock, _connect() as connection:
+        _held.discard(job_id)
+        connection.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, error, time.time(), job_id)
+        )
+
+def _work(handler):
+    while not _stopping.is_set():
+        job = _claim_next()
+        if job is None:
+            timeout = _seconds_until_next_due()
+            with _wakeup:
+                _wakeup.wait(timeout=timeout)
+            continue
+
+        logger.info(f"Processing job {job['id']} for document {job['document_id']}.")
+        try:
+            # A handler may report that there was nothing to do
+            status = handler(job) or "done"
+            _finish(job["id"], status)
+        except Exception as e:
+            logger.exception(f"Job {job['id']} failed.")
+            _finish(job["id"], "failed", error=str(e))
+
+def start_workers(handler, count: int = None, requeue_interrupted: bool = True):
+    init_queue(requeue_interrupted)
+    count = count or Config.WORKER_COUNT
+    _stopping.clear()
+    for index in range(count):
+        worker = threading.Thread(target=_work, args=(handler,), name=f"job-worker-{index}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+    logger.info(f"Started {count} job workers.")
+
+def stop_workers(timeout: float = None):
+    """ Let running jobs finish, then stop the workers """
+    logger.info(f"Stopping {len(_workers)} job workers, waiting for running jobs.")
+    _stopping.set()
+    with _wakeup:
+        _wakeup.notify_all()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers.clear()
@@ -0,0 +1,74 @@
+import numpy as np
+
+from config import Config
+
+# Metadata keys of the stored document chunks that are voted on
+FIELDS = {"correspondent": "correspondent_id", "document_type": "document_type_id"}
+# Keeps the weight of an exact duplicate finite
+EPSILON = 1e-3
+
+def neighbours(matches: dict, exclude_id = None, k: int = None) -> tuple:
+    """ The k nearest parent documents of a chroma query result as metadata list and distance array
+
+    Parents are ranked like chunking.aggregate_distances, by the mean over the query
+    chunks of their best chunk distance, with the worst distance of a row for a parent
+    that did not show up in it.
+    """
+    k = k or Config.KNN_NEIGHBOURS
+    distances = np.asarray(matches["distances"], dtype=np.float64)
+    if distances.size == 0:
+        return [], np.zeros(0)
+
+    metadatas = [metadata for row in matches["metadatas"] for metadata in row]
+    parent_ids = np.array([str(metadata.get("parent_id", metadata.get("id"))) for metadata in metadatas])
+    parents, first_index, inverse = np.unique(parent_ids, return_index=True, return_inverse=True)
+    rows = np.repeat(np.arange(distances.shape[0]), distances.shape[1])
+    best = np.repeat(distances.max(axis=1, keepdims=True), len(parents), axis=1)
+    np.minimum.at(best, (rows, inverse), distances.ravel())
+    mean = best.mean(axis=0)
+    if exclude_id is not None:
+        mean[parents == str(exclude_id)] = np.inf
+
+    order = np.argsort(mean, kind="stable")[:k]
+    order = order[np.isfinite(mean[order])]
+    return [metadatas[first_index[i]] for i in order], mean[order]
+
+def query_size(k: int = None) -> int:
+    """ Chunk results to query for k parent documents, each of them and the excluded document can fill up to MAX_CHUNKS_PER_DOCUMENT """
+    k = k or Config.KNN_NEIGHBOURS
+    chunks = min((k + 1) * Config.MAX_CHUNKS_PER_DOCUMENT, Config.KNN_MAXIMUM_CHUNK_RESULTS)
+    return max(Config.SIMILAR_CHUNK_RESULTS, chunks)
+
+def vote(labels: list, distances: np.ndarray) -> tuple:
+    """ Distance-weighted vote, returns the winning label with its share of the total weight and its number of votes """
+    if len(labels) == 0:
+        return None, 0.0, 0
+    weights = 1.0 / (distances + EPSILON)
+    candidates, inverse = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+    totals = np.bincount(inverse, weights=weights)
+    winner = int(np.argmax(totals))
+    return str(candidates[winner]), float(totals[winner] / totals.sum()), int(np.count_nonzero(inverse == winner))
+
+def votes(matches: dict, exclude_id = None, k: int = None, maximum_distance: float = None) -> dict:
+    """ Vote of the nearest documents within maximum_distance on every field """
+    maximum_distance = Config.KNN_MAXIMUM_DISTANCE if maximum_distance is None else maximum_distance
+    metadatas, distances = neighbours(matches, exclude_id, k)
+    within = distances <= maximum_distance
+    metadatas = [metadata for metadata, keep in zip(metadatas, within) if keep]
+    return {
+        field: vote([metadata.get(key) for metadata in metadatas], distances[within])
+        for field, key in FIELDS.items()
+    }
+
+def is_confident(label: str, confidence: float, support: int, minimum_confidence: float = None) -> bool:
+    """ Whether a vote is safe to use instead of asking the LLM, documents without a value never are """
+    minimum_confidence = Config.KNN_MINIMUM_CONFIDENCE if minimum_confidence is None else minimum_confidence
+    return label not in (None, "None") and confidence >= minimum_confidence and support >= Config.KNN_MINIMUM_VOTES
+
+def predict(matches: dict, exclude_id = None) -> dict:
+    """ Paperless ids of the fields with a confident vote, the other fields are left out """
+    return {
+        field: int(label)
+        for field, (label, confidence, support) in votes(matches, exclude_id).items()
+        if is_confident(label, confidence, support)
+    }
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from contextlib import closing
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_initialized = False
+
+def _connect():
+    os.makedirs(os.path.dirname(Config.LEDGER_DATABASE) or ".", exist_ok=True)
+    connection = sqlite3.connect(Config.LEDGER_DATABASE, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    return closing(connection)
+
+def _init(connection):
+    global _initialized
+    if _initialized:
+        return
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS documents (
+            document_id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            stages TEXT NOT NULL,
+            result TEXT NOT NULL,
+            processed_at REAL NOT NULL,
+            modified TEXT
+        )
+    """)
+    columns = {row["name"] for row in connection.execute("PRAGMA table_info(documents)")}
+    if "modified" not in columns:
+        connection.execute("ALTER TABLE documents ADD COLUMN modified TEXT")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS decisions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            skipped TEXT NOT NULL,
+            distance REAL,
+            neighbour_id TEXT,
+            decided_at REAL NOT NULL
+        )
+    """)
+    _initialized = True
+
+def fingerprint(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+def get(document_id: int) -> dict:
+    """ Ledger entry of a document with its stage fingerprints and last result, or None """
+    if not Config.LEDGER_ENABLED:
+        return None
+    with _lock, _connect() as connection:
+        _init(connection)
+        row = connection.execute("SELECT * FROM documents WHERE document_id = ?", (document_id,)).fetchone()
+    if row is None:
+        return None
+    return {
+        "document_id": row["document_id"],
+        "content_hash": row["content_hash"],
+        "stages": json.loads(row["stages"]),
+        "result": json.loads(row["result"]),
+        "processed_at": row["processed_at"],
+        "modified": row["modified"]
+    }
+
+def stale_stages(entry: dict, document_content_hash: str, fingerprints: dict) -> set:
+    """ Stages whose input or model and prompt changed since the document was last processed """
+    if entry is None or entry["content_hash"] != document_content_hash:
+        return set(fingerprints)
+    return {stage for stage, value in fingerprints.items() if entry["stages"].get(stage) != value}
+
+def is_own_update(document: dict, fingerprints: dict) -> bool:
+    """ Whether the last change of a document is the update this service made and no stage went stale since """
+    entry = get(document["id"])
+    if entry is None or entry["modified"] is None or entry["modified"] != document.get("modified"):
+        return False
+    return not stale_stages(entry, content_hash(document["content"]), fingerprints)
+
+def record(document_id: int, document_content_hash: str, fingerprints: dict, result: dict, modified: str = None):
+    """ Merge the stages that just ran into the entry, stages of older content are dropped
+
+    modified is the timestamp Paperless returned for our update, a webhook for exactly
+    that change was triggered by ourselves.
+    """
+    if not Config.LEDGER_ENABLED:
+        return
+    previous = get(document_id)
+    stages = {}
+    merged_result = {}
+    if previous and previous["content_hash"] == document_content_hash:
+        stages = previous["stages"]
+        merged_result = previous["result"]
+    stages.update(fingerprints)
+    merged_result.update(result)
+    with _lock, _connect() as connection:
+        _init(connection)
+        connection.execute(
+            "INSERT OR REPLACE INTO documents (document_id, content_hash, stages, result, processed_at, modified) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (document_id, document_content_hash, json.dumps(stages), json.dumps(merged_result), time.time(), modified)
+        )
+
+def record_decision(document_id: int, path: str, skipped: list, distance: float = None, neighbour_id: str = None):
+    """ Record which classification path a document took and which LLM stages it skipped """
+    if not Config.LEDGER_ENABLED:
+        return
+    with _lock, _connect() as connection:
+        _init(connection)
+        connection.execute(
+            "INSERT INTO decisions (document_id, path, skipped, distance, neighbour_id, decided_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (document_id, path, json.dumps(sorted(skipped)), distance, neighbour_id, time.time())
+        )
+
+def decision_stats() -> dict:
+    """ Documents per classification path and skipped LLM stages over all recorded decisions """
+    paths = {}
+    skipped = {}
+    if Config.LEDGER_ENABLED and os.path.exists(Config.LEDGER_DATABASE):
+        with _lock, _connect() as connection:
+            _init(connection)
+            paths = dict(connection.execute("SELECT path, COUNT(*) FROM decisions GROUP BY path").fetchall())
+            skipped = dict(connection.execute(
+                "SELECT stage.value, COUNT(*) FROM decisions, json_each(decisions.skipped) AS stage GROUP BY stage.value"
+            ).fetchall())
+    return {"paths": paths, "skipped": skipped, "total": sum(paths.values())}
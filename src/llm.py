@@ -1,7 +1,138 @@
-import ollama
+import math
+import logging
+import threading
+
+import cache
 from config import Config
+from metrics import cache_lookups
+from metrics import observe_response
+from metrics import timed
+from ollama_pool import HostPool
+
+logger = logging.getLogger(__name__)
+
+# The clients are created on first use, importing ollama alone adds noticeably to startup
+_pool_lock = threading.Lock()
+_pools = {}
+
+# Conservative for German OCR text, an underestimate would let Ollama truncate the prompt
+CHARS_PER_TOKEN = 3
+# Room for the JSON answer after the prompt
+RESPONSE_TOKENS = 256
+# Ollama reloads a model whenever num_ctx changes, so a process keeps the largest size it needed so far
+_context_sizes = {}
+
+def get_pool(kind: str) -> HostPool:
+    """ Host pool for "generate" or "embed" requests """
+    pool = _pools.get(kind)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(kind)
+            if pool is None:
+                pool = _pools[kind] = HostPool(kind, Config.OLLAMA_LLM_HOSTS if kind == "generate" else Config.OLLAMA_EMBEDDING_HOSTS)
+    return pool
+
+def keep_alive():
+    """ OLLAMA_KEEP_ALIVE as Ollama expects it, a duration like "30m" or a number of seconds with -1 for forever """
+    value = Config.OLLAMA_KEEP_ALIVE
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def context_size(model: str, prompt: str) -> int:
+    """ Smallest OLLAMA_NUM_CTX_BUCKETS entry that fits the prompt and answer, None without buckets """
+    buckets = sorted(Config.OLLAMA_NUM_CTX_BUCKETS)
+    if not buckets:
+        return None
+    needed = math.ceil(len(prompt or "") / CHARS_PER_TOKEN) + RESPONSE_TOKENS
+    size = next((bucket for bucket in buckets if bucket >= needed), buckets[-1])
+    with _pool_lock:
+        size = _context_sizes[model] = max(size, _context_sizes.get(model, 0))
+    return size
+
+def _with_residency(kwargs: dict, prompt: str = None) -> dict:
+    """ Add keep_alive and, for generate calls, num_ctx to the request """
+    kwargs = {**kwargs, "keep_alive": keep_alive()}
+    if prompt is not None:
+        num_ctx = context_size(kwargs.get("model"), prompt)
+        if num_ctx:
+            kwargs["options"] = {**(kwargs.get("options") or {}), "num_ctx": num_ctx}
+    return kwargs
+
+def warm_up_models():
+    """ Load the LLM and embedding model on every host, so the first document does not pay for loading them """
+    if not Config.OLLAMA_WARM_UP_ENABLED:
+        return
+    requests = (
+        ("generate", {"model": Config.OLLAMA_LLM_MODEL, "prompt": ""}, ""),
+        ("embed", {"model": Config.OLLAMA_EMBEDDING_MODEL, "input": "warm-up"}, None),
+    )
+    for kind, kwargs, prompt in requests:
+        for host, response in get_pool(kind).each(kind, **_with_residency(kwargs, prompt)):
+            if isinstance(response, Exception):
+                logger.warning(f"Loading {kwargs['model']} on {host.url} failed: {response}")
+                continue
+            observe_response(response)
+            load_seconds = (response.load_duration or 0) / 1e9
+            logger.info(f"Loaded {kwargs['model']} on {host.url} in {load_seconds:.1f}s.")
+
+def pool_stats() -> dict:
+    """ Outstanding requests, latency and health per host of both pools """
+    return {kind: get_pool(kind).stats() for kind in ("generate", "embed")}
+
+def _is_valid(validate, text: str) -> bool:
+    try:
+        validate(text)
+    except Exception:
+        return False
+    return True
+
+def generate(validate = None, **kwargs):
+    """ Generate with the response cache, a response is only cached once validate accepts it """
+    import ollama
+    key = cache.make_key(
+        "generate",
+        kwargs.get("model"),
+        prompt=kwargs.get("prompt"),
+        system=kwargs.get("system"),
+        format=kwargs.get("format"),
+        options=kwargs.get("options")
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        cache_lookups.labels("generate", "hit").inc()
+        return ollama.GenerateResponse(**cached)
+    cache_lookups.labels("generate", "miss").inc()
+
+    with timed("ollama_generate"):
+        response = get_pool("generate").call(
+            "generate", **_with_residency(kwargs, (kwargs.get("system") or "") + (kwargs.get("prompt") or ""))
+        )
+    observe_response(response)
+    # A malformed answer is not cached, it would be replayed on every retry
+    if validate is None or _is_valid(validate, response.response):
+        cache.put("generate", kwargs.get("model"), key, response.model_dump(mode="json", exclude={"context"}))
+    return response
+
+def embed(**kwargs):
+    import ollama
+    model = kwargs.get("model")
+    inputs = kwargs.get("input")
+    inputs = [inputs] if isinstance(inputs, str) else list(inputs)
 
-client = ollama.Client(host=Config.OLLAMA_HOST)
+    # Every input is cached on its own so batches with partially known inputs only embed the rest
+    keys = [cache.make_key("embed", model, input=text) for text in inputs]
+    embeddings = cache.get_many(keys)
+    missing = [(key, text) for key, text in zip(keys, inputs) if key not in embeddings]
+    cache_lookups.labels("embed", "hit").inc(len(keys) - len(missing))
+    cache_lookups.labels("embed", "miss").inc(len(missing))
+    if missing:
+        with timed("ollama_embed"):
+            response = get_pool("embed").call("embed", **_with_residency({**kwargs, "input": [text for _, text in missing]}))
+        observe_response(response)
+        generated = {key: list(embedding) for (key, _), embedding in zip(missing, response["embeddings"])}
+        cache.put_many("embed", model, generated)
+        embeddings.update(generated)
 
-generate = client.generate
-embed = client.embed
\ No newline at end of file
+    return ollama.EmbedResponse(model=model, embeddings=[embeddings[key] for key in keys])
@@ -1,13 +1,34 @@
 import flask
+import logging
 from flasgger import Swagger
 
 from functions import identify_and_update_document
 from functions import get_id_from_url
 from logger import setup_logging
 from paperless import get_document
+from ledger import is_own_update
+from ledger import decision_stats
 from functions import sync_tags
 from functions import sync_correspondents
 from functions import sync_document_types
+from functions import is_ready
+from functions import start_warm_up
+from functions import stage_fingerprints
+from jobs import enqueue
+from jobs import get_job
+from jobs import queue_stats
+from jobs import set_stage
+from jobs import start_workers
+from cache import stats as cache_stats
+from bulk import get_progress as get_bulk_progress
+from bulk import build_filters
+from bulk import start_run
+from metrics import render as render_metrics
+from metrics import timed
+from metrics import mean_seconds
+from llm import pool_stats
+
+logger = logging.getLogger(__name__)
 
 app = flask.Flask(__name__)
 swagger = Swagger(app)
@@ -85,23 +106,24 @@ def identify():
                 type: string
                 example: "http://localhost/api/documents/1/"
       responses:
-        200:
-          description: Document identified successfully
+        202:
+          description: Document queued for identification, repeated deliveries while it is queued share one job
           schema:
             type: object
             properties:
               status:
                 type: string
-                example: "success"
+                example: "queued"
+              job_id:
+                type: string
     """
     body = flask.request.get_json()
     url = body.get('url')
     id = get_id_from_url(url)
-    document = get_document(id)
 
-    identify_and_update_document(document)
-    
-    return {"status": "success"}
+    job_id = enqueue(id)
+
+    return {"status": "queued", "job_id": job_id}, 202
 
 @app.route('/identify/<int:id>', methods=['POST'])
 def identify_by_id(id):
@@ -114,24 +136,306 @@ def identify_by_id(id):
           name: id
           required: true
           type: integer
+      responses:
+        202:
+          description: Document queued for identification, repeated deliveries while it is queued share one job
+          schema:
+            type: object
+            properties:
+              status:
+                type: string
+                example: "queued"
+              job_id:
+                type: string
+    """
+    job_id = enqueue(id)
+
+    return {"status": "queued", "job_id": job_id}, 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Get the status of an identification job
+    ---
+    get:
+      description: Get the status of an identification job
+      parameters:
+        - in: path
+          name: job_id
+          required: true
+          type: string
       responses:
         200:
-          description: Document identified successfully
+          description: Job status
           schema:
             type: object
             properties:
+              id:
+                type: string
+              document_id:
+                type: integer
               status:
                 type: string
-                example: "success"
+                example: "running"
+              stage:
+                type: string
+                example: "generate"
+              error:
+                type: string
+        404:
+          description: Job not found
     """
-    document = get_document(id)
+    job = get_job(job_id)
+    if job is None:
+        return {"status": "not_found"}, 404
+    return job
 
-    identify_and_update_document(document)
-    
-    return {"status": "success"}
+@app.route('/jobs', methods=['GET'])
+def job_queue_stats():
+    """Get the number of jobs per status
+    ---
+    get:
+      description: Get the number of jobs per status
+      responses:
+        200:
+          description: Number of jobs per status
+          schema:
+            type: object
+            example: {"queued": 3, "running": 2, "done": 120}
+    """
+    return queue_stats()
+
+@app.route('/cache', methods=['GET'])
+def route_cache_stats():
+    """Get hit and miss counters of the LLM result cache
+    ---
+    get:
+      description: Get hit and miss counters of the LLM result cache
+      responses:
+        200:
+          description: Cache statistics
+          schema:
+            type: object
+            properties:
+              hits:
+                type: integer
+              misses:
+                type: integer
+              evictions:
+                type: integer
+              entries:
+                type: integer
+              enabled:
+                type: boolean
+    """
+    return cache_stats()
+
+@app.route('/ollama', methods=['GET'])
+def route_ollama_stats():
+    """Get the state of the Ollama hosts
+    ---
+    get:
+      description: Outstanding requests, request and error counts, mean latency and remaining eviction per host of the generate and embed pools
+      responses:
+        200:
+          description: Host statistics per pool
+          schema:
+            type: object
+            properties:
+              generate:
+                type: array
+                items:
+                  type: object
+              embed:
+                type: array
+                items:
+                  type: object
+    """
+    return pool_stats()
+
+@app.route('/decisions', methods=['GET'])
+def route_decision_stats():
+    """Get how documents were classified and which LLM calls were skipped
+    ---
+    get:
+      description: Documents per classification path, the share that skipped the LLM and the estimated time saved
+      responses:
+        200:
+          description: Decision statistics
+          schema:
+            type: object
+            properties:
+              paths:
+                type: object
+              skipped:
+                type: object
+              total:
+                type: integer
+              hit_rate:
+                type: number
+              estimated_seconds_saved:
+                type: number
+    """
+    stats = decision_stats()
+    predicted = stats["total"] - stats["paths"].get("llm", 0)
+    stats["hit_rate"] = predicted / stats["total"] if stats["total"] else 0.0
+    # Based on the generate_* durations this process observed, 0 until a stage ran once
+    stats["estimated_seconds_saved"] = sum(
+        count * (mean_seconds(f"generate_{stage}") or 0.0) for stage, count in stats["skipped"].items()
+    )
+    return stats
+
+@app.route('/reprocess', methods=['POST'])
+def reprocess():
+    """Reprocess a range of documents in bulk
+    ---
+    post:
+      description: Stream all matching documents through the pipeline with bounded concurrency
+      parameters:
+        - in: body
+          name: body
+          schema:
+            type: object
+            properties:
+              ids:
+                type: array
+                items:
+                  type: integer
+              tag_id:
+                type: integer
+              created_from:
+                type: string
+                example: "2024-01-01"
+              created_to:
+                type: string
+                example: "2024-12-31"
+              concurrency:
+                type: integer
+              run_id:
+                type: string
+                description: Resume the run with this id from its checkpoint, a run that is still active in this worker is returned as it is
+              force:
+                type: boolean
+                description: Also reprocess documents that are unchanged since they were last processed
+      responses:
+        202:
+          description: Bulk run started
+          schema:
+            type: object
+            properties:
+              status:
+                type: string
+                example: "running"
+              run_id:
+                type: string
+    """
+    body = flask.request.get_json() or {}
+    filters = build_filters(
+        ids=body.get('ids'),
+        tag_id=body.get('tag_id'),
+        created_from=body.get('created_from'),
+        created_to=body.get('created_to')
+    )
+    run = start_run(
+        filters,
+        concurrency=body.get('concurrency'),
+        run_id=body.get('run_id'),
+        force=bool(body.get('force', False))
+    )
+
+    return {"status": "running", "run_id": run.id}, 202
+
+@app.route('/reprocess/<run_id>', methods=['GET'])
+def reprocess_status(run_id):
+    """Get progress, throughput and ETA of a bulk run
+    ---
+    get:
+      description: Get progress, throughput and ETA of a bulk run. A run started by another web worker is reported as of its last checkpoint, without throughput and ETA
+      parameters:
+        - in: path
+          name: run_id
+          required: true
+          type: string
+      responses:
+        200:
+          description: Bulk run progress
+          schema:
+            type: object
+            properties:
+              status:
+                type: string
+              total:
+                type: integer
+              processed:
+                type: integer
+              skipped:
+                type: integer
+              failed:
+                type: integer
+              documents_per_minute:
+                type: number
+              eta_seconds:
+                type: integer
+        404:
+          description: Bulk run not found
+    """
+    progress = get_bulk_progress(run_id)
+    if progress is None:
+        return {"status": "not_found"}, 404
+    return progress
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness of the vector store
+    ---
+    get:
+      description: Ready once the ChromaDB store is open and the name indexes are loaded
+      responses:
+        200:
+          description: Ready to process documents
+          schema:
+            type: object
+            properties:
+              status:
+                type: string
+                example: "ready"
+        503:
+          description: Still warming up
+    """
+    if not is_ready():
+        return {"status": "warming_up"}, 503
+    return {"status": "ready"}
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics
+    ---
+    get:
+      description: Stage durations, Ollama token counts and durations, cache, validation and Paperless counters
+      produces:
+        - text/plain
+      responses:
+        200:
+          description: Metrics in the Prometheus text format
+    """
+    (body, content_type) = render_metrics()
+    return flask.Response(body, content_type=content_type)
+
+def process_identify_job(job):
+    with timed("identify"):
+        with timed("paperless_get"):
+            document = get_document(job["document_id"])
+        # Our own update triggers the Paperless workflow again, it is only dropped if no prompt or model changed since
+        if is_own_update(document, stage_fingerprints()):
+            logger.info(f"Dropping job {job['id']}, document {document['id']} was last changed by our own update.")
+            return "skipped"
+        updated_document = identify_and_update_document(document, progress=lambda stage: set_stage(job["id"], stage))
+        if updated_document is None:
+            return "skipped"
 
 
 if __name__ == "__main__":
     setup_logging()
+    start_warm_up()
+    start_workers(process_identify_job)
 
     app.run(host="0.0.0.0", port=5001)
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import time
+
+from contextlib import contextmanager
+from functools import wraps
+
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+from prometheus_client import REGISTRY
+from prometheus_client import generate_latest
+from prometheus_client import multiprocess
+
+# LLM calls take seconds to minutes, the default buckets stop at 10 seconds
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+stage_seconds = Histogram(
+    "paperless_ollama_stage_seconds",
+    "Duration of a pipeline stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+ollama_tokens = Histogram(
+    "paperless_ollama_ollama_tokens",
+    "Tokens per Ollama generate call",
+    ["model", "kind"],
+    buckets=TOKEN_BUCKETS
+)
+ollama_seconds = Histogram(
+    "paperless_ollama_ollama_seconds",
+    "Durations reported by Ollama per generate call",
+    ["model", "phase"],
+    buckets=STAGE_BUCKETS
+)
+entities_created = Counter(
+    "paperless_ollama_entities_created",
+    "Correspondents, document types and tags created in Paperless",
+    ["kind"]
+)
+cache_lookups = Counter(
+    "paperless_ollama_cache_lookups",
+    "LLM result cache lookups",
+    ["kind", "result"]
+)
+validation_failures = Counter(
+    "paperless_ollama_validation_failures",
+    "LLM responses that failed validation",
+    ["field"]
+)
+classification_decisions = Counter(
+    "paperless_ollama_classification_decisions",
+    "Documents per classification path",
+    ["path"]
+)
+llm_calls_skipped = Counter(
+    "paperless_ollama_llm_calls_skipped",
+    "Generate calls a document did not need because its fields were predicted",
+    ["stage"]
+)
+ollama_host_seconds = Histogram(
+    "paperless_ollama_ollama_host_seconds",
+    "Duration of requests per Ollama host",
+    ["pool", "host"],
+    buckets=STAGE_BUCKETS
+)
+ollama_host_errors = Counter(
+    "paperless_ollama_ollama_host_errors",
+    "Failed requests per Ollama host",
+    ["pool", "host"]
+)
+ollama_host_outstanding = Gauge(
+    "paperless_ollama_ollama_host_outstanding",
+    "Requests in flight or waiting for a slot per Ollama host",
+    ["pool", "host"],
+    multiprocess_mode="livesum"
+)
+paperless_responses = Counter(
+    "paperless_ollama_paperless_responses",
+    "HTTP responses received from Paperless",
+    ["method", "status"]
+)
+
+@contextmanager
+def timed(stage: str):
+    """ Observe the duration of the enclosed block as the given stage """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.labels(stage).observe(time.perf_counter() - start)
+
+def timed_stage(stage: str):
+    """ Decorator form of timed """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def observe_response(response):
+    """ Record token counts and durations (reported in nanoseconds) of an Ollama generate or embed response """
+    model = response.model or "unknown"
+    if response.prompt_eval_count is not None:
+        ollama_tokens.labels(model, "prompt").observe(response.prompt_eval_count)
+    if response.eval_count is not None:
+        ollama_tokens.labels(model, "eval").observe(response.eval_count)
+    for phase in ("total", "load", "prompt_eval", "eval"):
+        duration = getattr(response, f"{phase}_duration")
+        if duration is not None:
+            ollama_seconds.labels(model, phase).observe(duration / 1e9)
+
+def mean_seconds(stage: str) -> float:
+    """ Mean observed duration of a stage in this process, None before the first observation """
+    samples = {sample.name: sample.value for sample in stage_seconds.collect()[0].samples if sample.labels.get("stage") == stage}
+    count = samples.get("paperless_ollama_stage_seconds_count", 0)
+    return samples["paperless_ollama_stage_seconds_sum"] / count if count else None
+
+def render():
+    """ Exposition of all metrics, aggregated over worker processes when running multi-process """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
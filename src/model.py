@@ -18,4 +18,12 @@ class DocumentTitel(BaseModel):
 """ Tax Report Relevant Model """
 class TaxReportRelevant(BaseModel):
     """ Tax Report Relevance """
-    relevant: bool
\ No newline at end of file
+    relevant: bool
+
+""" Document Classification Model """
+class DocumentClassification(BaseModel):
+    """ Title, sender, document type and tax relevance of a document in one response """
+    titel: str
+    sender: str
+    document_type: str
+    tax_relevant: bool
@@ -0,0 +1,148 @@
+import re
+import logging
+import threading
+
+import numpy as np
+
+from chroma import space_of
+from chroma import get_pages
+from chroma import get_correspondents_collection
+from chroma import get_document_types_collection
+from chroma import get_tags_collection
+
+logger = logging.getLogger(__name__)
+
+UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+LEGAL_FORM_SUFFIX = re.compile(
+    r"(\s+(gmbh\s*&\s*co\s*kg|gmbh|mbh|ag|kg|kgaa|ohg|gbr|ug|se|ev|ek|eg|ltd|inc|plc|co))+$"
+)
+
+def space_distances(matrix: np.ndarray, query: np.ndarray, space: str, squared_norms: np.ndarray = None) -> np.ndarray:
+    """ Distances of all rows to the query as chroma computes them in the given space """
+    products = matrix @ query
+    if space == "cosine":
+        norms = np.sqrt(squared_norms if squared_norms is not None else np.einsum("ij,ij->i", matrix, matrix))
+        return 1.0 - products / np.maximum(norms * np.linalg.norm(query), 1e-12)
+    if space == "ip":
+        return 1.0 - products
+    if squared_norms is None:
+        squared_norms = np.einsum("ij,ij->i", matrix, matrix)
+    return squared_norms - 2 * products + query @ query
+
+def normalize(name: str) -> str:
+    """ Case-, umlaut- and legal-form-insensitive form of a name """
+    normalized = name.casefold().translate(UMLAUTS)
+    normalized = re.sub(r"[.,()\"']", "", normalized)
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    stripped = LEGAL_FORM_SUFFIX.sub("", normalized).strip()
+    return stripped or normalized
+
+class NameIndex:
+    """ In-process lookup of a small name catalog by exact, normalized and embedding match """
+
+    def __init__(self, get_collection):
+        self.get_collection = get_collection
+        self.lock = threading.RLock()
+        self.ready = False
+        self.entries = {}
+        self.by_name = {}
+        self.by_normalized = {}
+        self.ids = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.squared_norms = np.zeros(0, dtype=np.float32)
+        self.space = "l2"
+
+    @property
+    def collection(self):
+        return self.get_collection()
+
+    def load(self):
+        """ Build the index from the collection, read page by page """
+        pages = list(get_pages(self.collection, include=["metadatas", "embeddings"]))
+        with self.lock:
+            self.space = space_of(self.collection)
+            self.entries = {}
+            self.ids = []
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+            self._add(
+                [id for page in pages for id in page["ids"]],
+                [metadata for page in pages for metadata in page["metadatas"]],
+                [embedding for page in pages for embedding in page["embeddings"]]
+            )
+            self.ready = True
+        logger.info(f"Loaded name index for '{self.collection.name}' with {len(self.ids)} entries.")
+
+    def ensure_loaded(self):
+        if not self.ready:
+            with self.lock:
+                if not self.ready:
+                    self.load()
+
+    def _rebuild_lookups(self):
+        self.by_name = {metadata["name"]: metadata for metadata in self.entries.values()}
+        self.by_normalized = {}
+        for metadata in self.entries.values():
+            self.by_normalized.setdefault(normalize(metadata["name"]), metadata)
+
+    def _add(self, ids, metadatas, embeddings):
+        vectors = {}
+        for id, metadata, embedding in zip(ids, metadatas, embeddings):
+            self.entries[id] = metadata
+            if embedding is not None:
+                vectors[id] = np.asarray(embedding, dtype=np.float32)
+
+        if vectors:
+            keep = [i for i, id in enumerate(self.ids) if id not in vectors]
+            rows = [self.matrix[i] for i in keep] + list(vectors.values())
+            self.ids = [self.ids[i] for i in keep] + list(vectors.keys())
+            self.matrix = np.vstack(rows)
+            self.squared_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self._rebuild_lookups()
+
+    def upsert(self, ids: list, metadatas: list, embeddings: list):
+        with self.lock:
+            self._add(ids, metadatas, embeddings)
+
+    def refresh(self, ids: list):
+        """ Re-read the given entries from the collection after they were written """
+        if not self.ready or not ids:
+            return
+        stored = self.collection.get(ids=list(ids), include=["metadatas", "embeddings"])
+        self.upsert(stored["ids"], stored["metadatas"], stored["embeddings"])
+
+    def remove(self, ids):
+        if not ids:
+            return
+        with self.lock:
+            ids = set(ids)
+            for id in ids:
+                self.entries.pop(id, None)
+            keep = [i for i, id in enumerate(self.ids) if id not in ids]
+            self.ids = [self.ids[i] for i in keep]
+            self.matrix = self.matrix[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+            self.squared_norms = self.squared_norms[keep] if keep else np.zeros(0, dtype=np.float32)
+            self._rebuild_lookups()
+
+    def lookup(self, name: str):
+        """ Exact, then normalized name match without any embedding """
+        self.ensure_loaded()
+        with self.lock:
+            return self.by_name.get(name) or self.by_normalized.get(normalize(name))
+
+    def nearest(self, embedding, max_distance: float):
+        """ Closest entry by the distance of the collection's space, squared L2 unless configured otherwise """
+        self.ensure_loaded()
+        with self.lock:
+            if not self.ids:
+                return None
+            query = np.asarray(embedding, dtype=np.float32)
+            distances = space_distances(self.matrix, query, self.space, self.squared_norms)
+            best = int(np.argmin(distances))
+            distance = float(distances[best])
+            if distance > max_distance:
+                return None
+            return (self.entries[self.ids[best]], distance)
+
+correspondents_index = NameIndex(get_correspondents_collection)
+document_types_index = NameIndex(get_document_types_collection)
+tags_index = NameIndex(get_tags_collection)
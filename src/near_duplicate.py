@@ -0,0 +1,84 @@
+import re
+
+from datetime import date
+
+MONTH_NAMES = (
+    "Januar", "Februar", "März", "April", "Mai", "Juni",
+    "Juli", "August", "September", "Oktober", "November", "Dezember"
+)
+
+DATE_TOKENS = re.compile(
+    r"(?P<ymd>\b\d{4}-\d{2}-\d{2}\b)"
+    r"|(?P<dmy>\b\d{2}\.\d{2}\.\d{4}\b)"
+    r"|(?P<ym>\b\d{4}-\d{2}\b)"
+    r"|(?P<my>\b\d{2}[./]\d{4}\b)"
+    rf"|(?P<month_name>\b(?:{'|'.join(MONTH_NAMES)})\s+\d{{4}}\b)"
+    r"|(?P<year>\b(?:19|20)\d{2}\b)"
+)
+
+# Recurring documents name the period they cover, which is at most a year away from their date
+MAXIMUM_MONTH_OFFSET = 12
+
+def parse_date(value: str) -> date:
+    """ Date part of a Paperless created value, None if it is missing or invalid """
+    try:
+        return date.fromisoformat((value or "")[:10])
+    except ValueError:
+        return None
+
+def _add_months(year: int, month: int, offset: int) -> tuple:
+    index = year * 12 + month - 1 + offset
+    return index // 12, index % 12 + 1
+
+class _NotTransferable(Exception):
+    pass
+
+def _shift(match, reference: date, target: date) -> str:
+    kind = match.lastgroup
+    value = match.group()
+    if kind in ("ymd", "dmy"):
+        day = date.fromisoformat(value) if kind == "ymd" else date(int(value[6:]), int(value[3:5]), int(value[:2]))
+        # A full date in the title is only the document date itself
+        if day != reference:
+            raise _NotTransferable()
+        return target.isoformat() if kind == "ymd" else target.strftime("%d.%m.%Y")
+
+    if kind == "year":
+        offset = int(value) - reference.year
+        if abs(offset) > 1:
+            raise _NotTransferable()
+        return str(target.year + offset)
+
+    if kind == "ym":
+        year, month = int(value[:4]), int(value[5:7])
+    elif kind == "my":
+        year, month = int(value[3:]), int(value[:2])
+    else:
+        name, year = value.split()
+        year, month = int(year), MONTH_NAMES.index(name) + 1
+    offset = (year * 12 + month) - (reference.year * 12 + reference.month)
+    if abs(offset) > MAXIMUM_MONTH_OFFSET or not 1 <= month <= 12:
+        raise _NotTransferable()
+    year, month = _add_months(target.year, target.month, offset)
+    if kind == "ym":
+        return f"{year:04d}-{month:02d}"
+    if kind == "my":
+        return f"{month:02d}{value[2]}{year:04d}"
+    return f"{MONTH_NAMES[month - 1]} {year}"
+
+def derive_title(title: str, created: str, new_created: str) -> str:
+    """ Title for a new document from a near-duplicate's title, shifting its dates by the difference of their dates
+
+    "Gehaltsabrechnung Firma XY 2024-05" of a document created on 2024-06-01 becomes
+    "Gehaltsabrechnung Firma XY 2024-06" for a document created on 2024-07-01. Returns
+    None if the title has no date to carry over or a date that does not relate to the
+    document date, such a title is not a template.
+    """
+    reference = parse_date(created)
+    target = parse_date(new_created)
+    if not title or reference is None or target is None or not DATE_TOKENS.search(title):
+        return None
+    try:
+        return DATE_TOKENS.sub(lambda match: _shift(match, reference, target), title)
+    except (_NotTransferable, ValueError):
+        return None
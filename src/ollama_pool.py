@@ -0,0 +1,185 @@
+import time
+import logging
+import threading
+
+from config import Config
+from metrics import ollama_host_errors
+from metrics import ollama_host_outstanding
+from metrics import ollama_host_seconds
+
+logger = logging.getLogger(__name__)
+
+class Host:
+    """ One Ollama server with its own client, concurrency limit and health state """
+
+    def __init__(self, pool: str, url: str):
+        self.pool = pool
+        self.url = url
+        self.lock = threading.Lock()
+        # Ollama serves at most OLLAMA_NUM_PARALLEL requests per model at once, more would only queue up server-side
+        self.slots = threading.BoundedSemaphore(Config.OLLAMA_NUM_PARALLEL)
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.seconds = 0.0
+        self.evicted_until = 0.0
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self.lock:
+                if self._client is None:
+                    import ollama
+                    self._client = ollama.Client(host=self.url, timeout=Config.OLLAMA_TIMEOUT_SECONDS)
+        return self._client
+
+    def is_evicted(self, now: float) -> bool:
+        return self.evicted_until > now
+
+    def begin(self):
+        with self.lock:
+            self.outstanding += 1
+        ollama_host_outstanding.labels(self.pool, self.url).inc()
+
+    def end(self, seconds: float, failed: bool):
+        with self.lock:
+            self.outstanding -= 1
+            self.requests += 1
+            self.seconds += seconds
+            if failed:
+                self.errors += 1
+                self.consecutive_errors += 1
+            else:
+                self.consecutive_errors = 0
+        ollama_host_outstanding.labels(self.pool, self.url).dec()
+        ollama_host_seconds.labels(self.pool, self.url).observe(seconds)
+        if failed:
+            ollama_host_errors.labels(self.pool, self.url).inc()
+
+    def evict(self, reason: str):
+        with self.lock:
+            self.evicted_until = time.monotonic() + Config.OLLAMA_HOST_EVICTION_SECONDS
+        logger.warning(f"Evicting Ollama host {self.url} from the {self.pool} pool for {Config.OLLAMA_HOST_EVICTION_SECONDS}s: {reason}")
+
+    def restore(self):
+        with self.lock:
+            was_evicted = self.evicted_until > 0
+            self.evicted_until = 0.0
+            self.consecutive_errors = 0
+        if was_evicted:
+            logger.info(f"Ollama host {self.url} of the {self.pool} pool is healthy again.")
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "host": self.url,
+                "outstanding": self.outstanding,
+                "requests": self.requests,
+                "errors": self.errors,
+                "mean_seconds": self.seconds / self.requests if self.requests else None,
+                "evicted_for_seconds": max(self.evicted_until - time.monotonic(), 0.0),
+            }
+
+def _is_host_failure(error: Exception) -> bool:
+    """ Errors another host may not have, a bad request fails the same way everywhere """
+    import httpx
+    import ollama
+    if isinstance(error, ollama.ResponseError):
+        # 404 is a model that is not pulled on this host
+        return error.status_code >= 500 or error.status_code in (404, 429)
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+class HostPool:
+    """ Routes requests to the healthy host with the fewest outstanding requests and retries on another one """
+
+    def __init__(self, name: str, urls: list):
+        if not urls:
+            raise Exception(f"Keine Ollama-Hosts für '{name}' konfiguriert.")
+        self.name = name
+        self.hosts = [Host(name, url) for url in urls]
+        self.lock = threading.Lock()
+        self.health_check = None
+
+    def _pick(self, tried: set) -> Host:
+        now = time.monotonic()
+        with self.lock:
+            candidates = [host for host in self.hosts if host not in tried]
+            healthy = [host for host in candidates if not host.is_evicted(now)]
+            if healthy:
+                return min(healthy, key=lambda host: host.outstanding)
+            # With every host evicted the one that comes back first is still better than failing
+            return min(candidates, key=lambda host: host.evicted_until) if candidates else None
+
+    def call(self, method: str, **kwargs):
+        """ Run a client method on the least busy host, trying each host at most once """
+        self.start_health_checks()
+        tried = set()
+        while True:
+            host = self._pick(tried)
+            tried.add(host)
+            host.begin()
+            start = time.perf_counter()
+            try:
+                with host.slots:
+                    result = getattr(host.client, method)(**kwargs)
+            except Exception as e:
+                host.end(time.perf_counter() - start, failed=True)
+                if not _is_host_failure(e):
+                    raise
+                if host.consecutive_errors >= Config.OLLAMA_HOST_MAXIMUM_ERRORS:
+                    host.evict(str(e))
+                if len(tried) == len(self.hosts):
+                    raise
+                logger.warning(f"Ollama host {host.url} failed ({e}), retrying on another host.")
+                continue
+            host.end(time.perf_counter() - start, failed=False)
+            return result
+
+    def each(self, method: str, **kwargs) -> list:
+        """ Run a client method on every host, returning (host, result or exception) pairs """
+        results = []
+        for host in self.hosts:
+            host.begin()
+            start = time.perf_counter()
+            try:
+                with host.slots:
+                    result = getattr(host.client, method)(**kwargs)
+            except Exception as e:
+                host.end(time.perf_counter() - start, failed=True)
+                results.append((host, e))
+                continue
+            host.end(time.perf_counter() - start, failed=False)
+            results.append((host, result))
+        return results
+
+    def check(self):
+        """ Probe every host, evicting the unreachable ones and restoring the recovered ones """
+        for host in self.hosts:
+            try:
+                host.client.ps()
+            except Exception as e:
+                host.evict(f"health check failed: {e}")
+                continue
+            host.restore()
+
+    def start_health_checks(self):
+        if self.health_check is not None or Config.OLLAMA_HEALTH_CHECK_SECONDS <= 0:
+            return
+        with self.lock:
+            if self.health_check is not None:
+                return
+            self.health_check = threading.Thread(target=self._check_periodically, name=f"ollama-health-{self.name}", daemon=True)
+            self.health_check.start()
+
+    def _check_periodically(self):
+        while True:
+            time.sleep(Config.OLLAMA_HEALTH_CHECK_SECONDS)
+            try:
+                self.check()
+            except Exception:
+                logger.exception(f"Health check of the {self.name} pool failed.")
+
+    def stats(self) -> list:
+        return [host.stats() for host in self.hosts]
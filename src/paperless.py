@@ -1,16 +1,53 @@
 import requests
 import logging
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from config import Config
+from metrics import paperless_responses
 
 logger = logging.getLogger(__name__)
 
+def _log_latency(response, *args, **kwargs):
+    paperless_responses.labels(response.request.method, str(response.status_code)).inc()
+    logger.info(
+        f"{response.request.method} {response.url} -> {response.status_code} "
+        f"in {response.elapsed.total_seconds() * 1000:.0f} ms"
+    )
+
+def _create_session() -> requests.Session:
+    # POST is not retried because a create that reached Paperless would be duplicated
+    retry = Retry(
+        total=Config.PAPERLESS_RETRIES,
+        backoff_factor=Config.PAPERLESS_BACKOFF_FACTOR,
+        backoff_jitter=Config.PAPERLESS_BACKOFF_JITTER,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "PATCH", "PUT", "DELETE", "HEAD", "OPTIONS"}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=Config.PAPERLESS_POOL_SIZE,
+        pool_maxsize=Config.PAPERLESS_POOL_SIZE,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.headers.update(Config.API_HEADERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.hooks["response"].append(_log_latency)
+    return session
+
+session = _create_session()
+TIMEOUT = (Config.PAPERLESS_CONNECT_TIMEOUT, Config.PAPERLESS_READ_TIMEOUT)
+
 def create_tag(name: str):
     logger.info(f"create_tag: {name}")
     data = {
         "name": name
     }
-    response = requests.post(Config.TAGS_API_URL, headers=Config.API_HEADERS, json=data)
+    response = session.post(Config.TAGS_API_URL, timeout=TIMEOUT, json=data)
     if response.status_code == 201:
         return response.json()
     else:
@@ -21,7 +58,7 @@ def create_correspondent(name: str):
     data = {
         "name": name
     }
-    response = requests.post(Config.CORRESPONDENTS_API_URL, headers=Config.API_HEADERS, json=data)
+    response = session.post(Config.CORRESPONDENTS_API_URL, timeout=TIMEOUT, json=data)
     if response.status_code == 201:
         return response.json()
     else:
@@ -33,7 +70,7 @@ def create_document_type(name: str):
     data = {
         "name": name
     }
-    response = requests.post(Config.DOCUMENT_TYPES_API_URL, headers=Config.API_HEADERS, json=data)
+    response = session.post(Config.DOCUMENT_TYPES_API_URL, timeout=TIMEOUT, json=data)
     if response.status_code == 201:
         response = response.json()
         return response
@@ -60,45 +97,98 @@ def update_document(
 
     logger.info(f"update_document data: {data}")
 
-    response = requests.patch(f"{Config.API_BASE}/api/documents/{document_id}/", headers=Config.API_HEADERS, json=data)
+    response = session.patch(f"{Config.API_BASE}/api/documents/{document_id}/", timeout=TIMEOUT, json=data)
     if response.status_code == 200:
         return response.json()
     else:
         raise Exception(f"Fehler beim Aktualisieren des Dokuments: {response.status_code} - {response.text}")
     
-def get_correspondents():
+def iter_results(
+        url: str,
+        error_message: str,
+        params: dict = None,
+        page_size: int = None,
+        fields: list = None,
+        page: int = 1
+    ):
+    """ Yield the results of a paginated list endpoint page by page, following 'next' """
+    params = dict(params or {})
+    params["page_size"] = page_size or Config.PAPERLESS_PAGE_SIZE
+    if page > 1:
+        params["page"] = page
+    if fields:
+        params["fields"] = ",".join(fields)
+
+    while url:
+        response = session.get(url, timeout=TIMEOUT, params=params)
+        if response.status_code != 200:
+            raise Exception(f"{error_message}: {response.status_code} - {response.text}")
+        data = response.json()
+        logger.debug(f"Fetched page {page} of {url} with {len(data['results'])} results.")
+        yield from data['results']
+        # 'next' already carries all query parameters
+        url = data.get('next')
+        params = None
+        page += 1
+
+def get_correspondents(page_size: int = None, fields: list = None):
     logger.info("get_correspondents")
-    response = requests.get(Config.CORRESPONDENTS_API_URL, headers=Config.API_HEADERS)
-    if response.status_code == 200:
-        return response.json()['results']
-    else:
-        raise Exception(f"Fehler beim Abrufen der Korrespondenten: {response.status_code} - {response.text}")
-    
-def get_document_types():
+    return iter_results(
+        Config.CORRESPONDENTS_API_URL,
+        "Fehler beim Abrufen der Korrespondenten",
+        page_size=page_size,
+        fields=fields
+    )
+
+def get_document_types(page_size: int = None, fields: list = None):
     logger.info("get_document_types")
-    response = requests.get(Config.DOCUMENT_TYPES_API_URL, headers=Config.API_HEADERS)
-    if response.status_code == 200:
-        return response.json()['results']
-    else:
-        raise Exception(f"Fehler beim Abrufen der Dokumententypen: {response.status_code} - {response.text}")
+    return iter_results(
+        Config.DOCUMENT_TYPES_API_URL,
+        "Fehler beim Abrufen der Dokumententypen",
+        page_size=page_size,
+        fields=fields
+    )
 
 def get_document(id: str) -> dict:
-    response = requests.get(f"{Config.DOCUMENT_API_URL}{id}/", headers=Config.API_HEADERS)
+    response = session.get(f"{Config.DOCUMENT_API_URL}{id}/", timeout=TIMEOUT)
     if response.status_code == 200:
         return response.json()
 
     raise Exception(f"Fehler beim Abrufen des Dokuments: {response.status_code} - {response.text}")
 
-def get_documents():
-    response = requests.get(Config.DOCUMENT_API_URL, headers=Config.API_HEADERS)
-    if response.status_code == 200:
-        return response.json()['results']
-
-    raise Exception(f"Fehler beim Abrufen der Dokumente: {response.status_code} - {response.text}")
+def get_documents(
+        modified_after: str = None,
+        ids: list = None,
+        filters: dict = None,
+        page_size: int = None,
+        fields: list = None,
+        page: int = 1
+    ):
+    params = dict(filters or {})
+    if modified_after:
+        params["modified__gt"] = modified_after
+    if ids:
+        params["id__in"] = ",".join(str(id) for id in ids)
+    return iter_results(
+        Config.DOCUMENT_API_URL,
+        "Fehler beim Abrufen der Dokumente",
+        params=params,
+        page_size=page_size,
+        fields=fields,
+        page=page
+    )
 
-def get_tags():
-    response = requests.get(Config.TAGS_API_URL, headers=Config.API_HEADERS)
+def count_documents(filters: dict = None) -> int:
+    response = session.get(Config.DOCUMENT_API_URL, timeout=TIMEOUT, params={**(filters or {}), "page_size": 1, "fields": "id"})
     if response.status_code == 200:
-        return response.json()['results']
+        return response.json()['count']
+
+    raise Exception(f"Fehler beim Zählen der Dokumente: {response.status_code} - {response.text}")
 
-    raise Exception(f"Fehler beim Abrufen der Tags: {response.status_code} - {response.text}")
\ No newline at end of file
+def get_tags(page_size: int = None, fields: list = None):
+    return iter_results(
+        Config.TAGS_API_URL,
+        "Fehler beim Abrufen der Tags",
+        page_size=page_size,
+        fields=fields
+    )
@@ -0,0 +1,50 @@
+import logging
+
+from batching import embed_and_upsert
+from chroma import delete_ids
+from chroma import get_pages
+
+logger = logging.getLogger(__name__)
+
+class Reconciliation:
+    """ Difference between the entries stored in a collection and the entities in Paperless """
+
+    def __init__(self):
+        self.inserts = []
+        self.updates = []
+        self.deletes = set()
+        self.current = {}
+
+    def __repr__(self):
+        return f"Reconciliation(inserts={len(self.inserts)}, updates={len(self.updates)}, deletes={len(self.deletes)})"
+
+def load_index(collection) -> dict:
+    """ Load the ids and metadatas of all stored entries page by page """
+    stored = {}
+    for page in get_pages(collection, include=["metadatas"]):
+        stored.update(zip(page["ids"], page["metadatas"]))
+    return stored
+
+def reconcile(stored: dict, incoming, metadata, partial: bool = False) -> Reconciliation:
+    """ Diff a stream of Paperless entities against the stored index by id and metadata """
+    result = Reconciliation()
+    for entity in incoming:
+        id = str(entity["id"])
+        entity_metadata = metadata(entity)
+        result.current[id] = entity_metadata
+        if id not in stored:
+            result.inserts.append(entity)
+        elif stored[id] != entity_metadata:
+            result.updates.append(entity)
+
+    # A partial stream (e.g. filtered by modification date) cannot tell which entries are gone
+    if not partial:
+        result.deletes = stored.keys() - result.current.keys()
+    return result
+
+def apply(collection, result: Reconciliation, text, metadata, batch_size: int = None):
+    """ Apply a reconciliation with one delete and batched upserts of inserted and renamed entries """
+    logger.info(f"Applying {result} to '{collection.name}'.")
+    if result.deletes:
+        delete_ids(collection, list(result.deletes))
+    embed_and_upsert(collection, result.inserts + result.updates, text, metadata, batch_size=batch_size)
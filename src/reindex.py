@@ -0,0 +1,100 @@
+import json
+import time
+import logging
+import argparse
+
+from logger import setup_logging
+from chroma import COLLECTION_NAMES
+from chroma import get_client
+from chroma import hnsw_configuration
+from chroma import index_configuration
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+def copy_collection(source, target, batch_size: int = BATCH_SIZE) -> int:
+    """ Copy ids, stored embeddings, metadatas and documents in pages, nothing is embedded again """
+    copied = 0
+    while True:
+        page = source.get(include=["embeddings", "metadatas", "documents"], limit=batch_size, offset=copied)
+        if not page["ids"]:
+            return copied
+        entries = {"ids": page["ids"], "embeddings": page["embeddings"]}
+        if any(page["metadatas"]):
+            entries["metadatas"] = [metadata or None for metadata in page["metadatas"]]
+        if any(document is not None for document in page["documents"]):
+            entries["documents"] = page["documents"]
+        target.add(**entries)
+        copied += len(page["ids"])
+
+def rebuild(name: str, swap: bool = False, drop_backup: bool = False, **overrides) -> dict:
+    """ Build a copy of a collection with the configured or given index settings
+
+    With swap the copy takes over the name and the original stays as a backup. Run it
+    while the service is stopped, writes to the original during the copy would be lost.
+    """
+    client = get_client()
+    source = client.get_collection(name)
+    configuration = index_configuration(name, **overrides)
+    suffix = time.strftime("%Y%m%d%H%M%S")
+    target = client.create_collection(f"{name}_reindex_{suffix}", configuration=configuration)
+
+    start = time.perf_counter()
+    copied = copy_collection(source, target)
+    if target.count() != source.count():
+        raise Exception(f"Neuaufbau von '{name}' unvollständig: {target.count()} von {source.count()} Einträgen kopiert.")
+    result = {
+        "collection": name,
+        "entries": copied,
+        "seconds": round(time.perf_counter() - start, 2),
+        "before": {key: value for key, value in hnsw_configuration(source).items() if key in configuration["hnsw"]},
+        "after": configuration["hnsw"],
+        "built": target.name,
+    }
+    logger.info(f"Copied {copied} entries of '{name}' into '{target.name}'.")
+
+    if swap:
+        backup = f"{name}_backup_{suffix}"
+        source.modify(name=backup)
+        target.modify(name=name)
+        result["built"] = name
+        result["backup"] = backup
+        logger.info(f"'{name}' now uses the rebuilt index, the original is kept as '{backup}'.")
+        if drop_backup:
+            client.delete_collection(backup)
+            result["backup"] = None
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild ChromaDB collections with new index settings from their stored embeddings, without calling Ollama. "
+                    "Settings default to CHROMA_* / CHROMA_<NAME>_*, run it while the service is stopped."
+    )
+    parser.add_argument("collections", nargs="*", help=f"collections to rebuild out of {', '.join(COLLECTION_NAMES)}, all by default")
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"], help="distance space")
+    parser.add_argument("--m", type=int, help="HNSW M (max_neighbors)")
+    parser.add_argument("--ef-construction", type=int, help="HNSW ef_construction")
+    parser.add_argument("--ef-search", type=int, help="HNSW ef_search")
+    parser.add_argument("--swap", action="store_true", help="replace the collection with the rebuilt one and keep the original as backup")
+    parser.add_argument("--drop-backup", action="store_true", help="delete the original after swapping")
+    args = parser.parse_args()
+
+    unknown = set(args.collections) - set(COLLECTION_NAMES)
+    if unknown:
+        parser.error(f"unknown collections: {', '.join(sorted(unknown))}")
+
+    setup_logging()
+    overrides = {
+        key: value for key, value in (
+            ("space", args.space),
+            ("max_neighbors", args.m),
+            ("ef_construction", args.ef_construction),
+            ("ef_search", args.ef_search),
+        ) if value is not None
+    }
+    for name in args.collections or COLLECTION_NAMES:
+        print(json.dumps(rebuild(name, swap=args.swap, drop_backup=args.drop_backup, **overrides)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import json
+import argparse
+
+from logger import setup_logging
+from bulk import BulkRun
+from bulk import build_filters
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocess a range of Paperless documents through the identification pipeline.")
+    parser.add_argument("--ids", type=int, nargs="+", help="document ids")
+    parser.add_argument("--tag-id", type=int, help="only documents with this tag")
+    parser.add_argument("--created-from", help="only documents created on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--created-to", help="only documents created on or before this date (YYYY-MM-DD)")
+    parser.add_argument("--concurrency", type=int, help="documents processed in parallel")
+    parser.add_argument("--batch-size", type=int, help="documents per metadata sync and checkpoint")
+    parser.add_argument("--run-id", help="resume the run with this id from its checkpoint")
+    parser.add_argument("--force", action="store_true", help="also reprocess documents the ledger marks as done")
+    args = parser.parse_args()
+
+    setup_logging()
+    filters = build_filters(
+        ids=args.ids,
+        tag_id=args.tag_id,
+        created_from=args.created_from,
+        created_to=args.created_to
+    )
+    run = BulkRun(filters, concurrency=args.concurrency, batch_size=args.batch_size, run_id=args.run_id, force=args.force)
+    print(f"Run id: {run.id} (pass --run-id {run.id} to resume)")
+    print(json.dumps(run.run()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import time
+import logging
+import threading
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class Snapshot:
+    """ Freshness of one Paperless entity kind in ChromaDB, the entities themselves are reconciled against the collection """
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.watermark = None
+        self.synced_at = None
+        self.dirty = True
+        self.lock = threading.RLock()
+
+    def is_stale(self) -> bool:
+        if self.dirty or self.synced_at is None:
+            return True
+        return time.monotonic() - self.synced_at > self.ttl
+
+    def mark_dirty(self):
+        logger.debug(f"Snapshot '{self.name}' marked dirty.")
+        self.dirty = True
+
+    def update(self, watermark: str = None):
+        if watermark is not None and (self.watermark is None or watermark > self.watermark):
+            self.watermark = watermark
+        self.synced_at = time.monotonic()
+        self.dirty = False
+
+def refresh_if_stale(snapshot: Snapshot, refresh) -> bool:
+    with snapshot.lock:
+        if not snapshot.is_stale():
+            return False
+        logger.info(f"Snapshot '{snapshot.name}' is stale, refreshing.")
+        refresh()
+        return True
+
+tags_snapshot = Snapshot("tags", Config.SYNC_TTL_SECONDS)
+correspondents_snapshot = Snapshot("correspondents", Config.SYNC_TTL_SECONDS)
+document_types_snapshot = Snapshot("document_types", Config.SYNC_TTL_SECONDS)
+documents_snapshot = Snapshot("documents", Config.SYNC_TTL_SECONDS)
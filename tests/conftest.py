@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Config reads the environment on import, a test run must never touch the data of an installation
+os.environ["DATA_DIRECTORY"] = tempfile.mkdtemp(prefix="paperless-ollama-test-")
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+import jobs
+from config import Config
+
+@pytest.fixture(autouse=True)
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "JOBS_DATABASE", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(jobs, "_held", set())
+    jobs.init_queue()
+
+def test_deliveries_for_a_queued_document_share_its_job():
+    first = jobs.enqueue(1, debounce=0)
+    assert jobs.enqueue(1, debounce=0) == first
+    assert jobs.enqueue(2, debounce=0) != first
+    assert jobs.queue_stats() == {"queued": 2}
+
+def test_a_delivery_pushes_the_start_of_the_queued_job_back():
+    job_id = jobs.enqueue(1, debounce=60)
+    assert jobs._claim_next() is None
+    jobs.enqueue(1, debounce=0)
+    assert jobs._claim_next()["id"] == job_id
+
+def test_a_delivery_during_a_running_job_waits_for_it():
+    running = jobs.enqueue(1, debounce=0)
+    assert jobs._claim_next()["id"] == running
+    waiting = jobs.enqueue(1, debounce=0)
+    assert waiting != running
+    assert jobs._claim_next() is None
+    jobs._finish(running, "done")
+    assert jobs._claim_next()["id"] == waiting
+
+def test_other_documents_are_claimed_while_one_is_running():
+    jobs.enqueue(1, debounce=0)
+    jobs.enqueue(2, debounce=0)
+    assert {jobs._claim_next()["document_id"], jobs._claim_next()["document_id"]} == {1, 2}
+
+def test_a_running_job_whose_lease_expired_is_claimed_again(monkeypatch):
+    job_id = jobs.enqueue(1, debounce=0)
+    jobs._claim_next()
+    # The process that held the job died, nobody renews its lease
+    jobs._held.clear()
+    monkeypatch.setattr(time, "time", lambda: jobs.get_job(job_id)["lease_until"] + 1)
+    job = jobs._claim_next()
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from config import Config
+from knn import is_confident
+from knn import neighbours
+from knn import query_size
+from knn import vote
+
+def test_vote_without_neighbours():
+    assert vote([], np.zeros(0)) == (None, 0.0, 0)
+
+def test_vote_weighs_closer_neighbours_more():
+    label, confidence, support = vote(["1", "2", "2"], np.array([0.01, 0.2, 0.2]))
+    assert label == "1"
+    assert support == 1
+    assert confidence == pytest.approx((1 / 0.011) / (1 / 0.011 + 2 / 0.201))
+
+def test_unanimous_vote_is_fully_confident():
+    assert vote(["3", "3", "3"], np.array([0.1, 0.2, 0.3])) == ("3", 1.0, 3)
+
+def test_exact_duplicate_keeps_a_finite_weight():
+    label, confidence, _ = vote(["1", "2"], np.array([0.0, 0.0]))
+    assert np.isfinite(confidence)
+    assert confidence == pytest.approx(0.5)
+
+def test_missing_value_is_never_confident(monkeypatch):
+    monkeypatch.setattr(Config, "KNN_MINIMUM_VOTES", 1)
+    assert not is_confident("None", 1.0, 5)
+    assert is_confident("4", 1.0, 5, minimum_confidence=0.9)
+    assert not is_confident("4", 0.8, 5, minimum_confidence=0.9)
+
+def test_neighbours_rank_parents_and_leave_out_the_document_itself():
+    matches = {
+        "metadatas": [[{"parent_id": "1"}, {"parent_id": "2"}, {"parent_id": "2"}, {"parent_id": "3"}]],
+        "distances": [[0.0, 0.1, 0.2, 0.3]],
+    }
+    metadatas, distances = neighbours(matches, exclude_id=1, k=5)
+    assert [metadata["parent_id"] for metadata in metadatas] == ["2", "3"]
+    assert distances.tolist() == pytest.approx([0.1, 0.3])
+
+def test_query_size_covers_every_chunk_of_k_documents(monkeypatch):
+    monkeypatch.setattr(Config, "SIMILAR_CHUNK_RESULTS", 20)
+    monkeypatch.setattr(Config, "MAX_CHUNKS_PER_DOCUMENT", 8)
+    monkeypatch.setattr(Config, "KNN_MAXIMUM_CHUNK_RESULTS", 100)
+    assert query_size(5) == 48
+    assert query_size(20) == 100
+    assert query_size(1) == 20
@@ -0,0 +1,52 @@
+import pytest
+
+import ledger
+from config import Config
+from ledger import content_hash
+from ledger import stale_stages
+
+FINGERPRINTS = {"title": "a", "correspondent": "b"}
+
+@pytest.fixture(autouse=True)
+def ledger_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "LEDGER_DATABASE", str(tmp_path / "ledger.sqlite3"))
+    monkeypatch.setattr(Config, "LEDGER_ENABLED", True)
+    monkeypatch.setattr(ledger, "_initialized", False)
+
+def entry(content: str = "text", stages: dict = FINGERPRINTS) -> dict:
+    return {"content_hash": content_hash(content), "stages": dict(stages)}
+
+def test_all_stages_are_stale_without_entry():
+    assert stale_stages(None, content_hash("text"), FINGERPRINTS) == {"title", "correspondent"}
+
+def test_all_stages_are_stale_when_the_content_changed():
+    assert stale_stages(entry("old text"), content_hash("text"), FINGERPRINTS) == {"title", "correspondent"}
+
+def test_no_stage_is_stale_when_nothing_changed():
+    assert stale_stages(entry(), content_hash("text"), FINGERPRINTS) == set()
+
+def test_only_stages_with_a_new_fingerprint_are_stale():
+    fingerprints = {**FINGERPRINTS, "correspondent": "new prompt", "tax_report_relevance": "c"}
+    assert stale_stages(entry(), content_hash("text"), fingerprints) == {"correspondent", "tax_report_relevance"}
+
+def test_record_keeps_the_stages_of_unchanged_content():
+    ledger.record(1, content_hash("text"), {"title": "a"}, {"title": "Rechnung"})
+    ledger.record(1, content_hash("text"), {"correspondent": "b"}, {"correspondent": 3})
+    assert stale_stages(ledger.get(1), content_hash("text"), FINGERPRINTS) == set()
+    assert ledger.get(1)["result"] == {"title": "Rechnung", "correspondent": 3}
+
+def test_record_drops_the_stages_of_older_content():
+    ledger.record(1, content_hash("old text"), {"title": "a"}, {"title": "Rechnung"})
+    ledger.record(1, content_hash("text"), {"correspondent": "b"}, {"correspondent": 3})
+    assert stale_stages(ledger.get(1), content_hash("text"), FINGERPRINTS) == {"title"}
+
+def test_our_own_update_is_recognized_by_its_modified_timestamp():
+    ledger.record(1, content_hash("text"), FINGERPRINTS, {}, modified="2025-01-01T10:00:00Z")
+    assert ledger.is_own_update({"id": 1, "content": "text", "modified": "2025-01-01T10:00:00Z"}, FINGERPRINTS)
+    assert not ledger.is_own_update({"id": 1, "content": "text", "modified": "2025-01-02T10:00:00Z"}, FINGERPRINTS)
+    assert not ledger.is_own_update({"id": 2, "content": "text", "modified": "2025-01-01T10:00:00Z"}, FINGERPRINTS)
+
+def test_our_own_update_is_processed_again_after_a_prompt_change():
+    ledger.record(1, content_hash("text"), FINGERPRINTS, {}, modified="2025-01-01T10:00:00Z")
+    document = {"id": 1, "content": "text", "modified": "2025-01-01T10:00:00Z"}
+    assert not ledger.is_own_update(document, {**FINGERPRINTS, "title": "new prompt"})